@@ -0,0 +1,276 @@
+import argparse
+import os
+import struct
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from candleStore import COLUMNS, DTYPES
+
+DAY_MS = 86_400_000
+
+SCHEMA_VERSION = 2
+MAGIC = b'CNDL'
+# magic, schema version, record size, symbol, timeframe, padding up to 64 bytes
+HEADER = struct.Struct('<4sHH24s8s24x')
+RECORD = np.dtype([(name, np.dtype(DTYPES[name]).newbyteorder('<')) for name in COLUMNS])
+# Records of older schema versions; they are converted on read and rewritten before any write
+LEGACY_RECORDS = {
+    1: np.dtype([(name, np.dtype(DTYPES[name]).newbyteorder('<')) for name in COLUMNS[:6]]),  # OHLCV only
+}
+
+def segment_name(day: int):
+    """File name of the segment holding bars of the given UTC day (epoch ms // DAY_MS)."""
+    return pd.Timestamp(day * DAY_MS, unit='ms').strftime('%Y-%m-%d') + '.bin'
+
+def read_header(path: str):
+    with open(path, 'rb') as f:
+        magic, version, record_size, symbol, timeframe = HEADER.unpack(f.read(HEADER.size))
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a candle segment")
+    record = RECORD if version == SCHEMA_VERSION else LEGACY_RECORDS.get(version)
+    if record is None or record_size != record.itemsize:
+        raise ValueError(f"{path} has schema version {version} with {record_size}-byte records, "
+                         f"expected version {SCHEMA_VERSION} with {RECORD.itemsize}-byte records")
+    return {'symbol': symbol.rstrip(b'\0').decode(), 'timeframe': timeframe.rstrip(b'\0').decode(),
+            'version': version, 'record': record}
+
+def open_records(path: str):
+    """Memory-maps the whole records of a segment; a record torn by a crash is ignored.
+
+    Segments of an older schema version are copied into RECORD rows, the columns they lack left 0.
+    """
+    record = read_header(path)['record']
+    count = (os.path.getsize(path) - HEADER.size) // record.itemsize
+    if count <= 0:
+        return np.empty(0, dtype=RECORD)
+    records = np.memmap(path, dtype=record, mode='r', offset=HEADER.size, shape=(count,))
+    if record is RECORD:
+        return records
+    upgraded = np.zeros(count, dtype=RECORD)
+    for name in record.names:
+        upgraded[name] = records[name]
+    return upgraded
+
+def upgrade_segment(path: str):
+    """Rewrites a segment of an older schema version in the current one, atomically."""
+    header = read_header(path)
+    if header['version'] == SCHEMA_VERSION:
+        return
+    records = open_records(path)
+    with open(path + '.tmp', 'wb') as f:
+        f.write(HEADER.pack(MAGIC, SCHEMA_VERSION, RECORD.itemsize, header['symbol'].encode(),
+                            header['timeframe'].encode()))
+        f.write(records.tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + '.tmp', path)
+
+class CandleWriter:
+    """Appends the closed bars of one timeframe to day-rotated binary segments.
+
+    A segment is a 64-byte header (magic, schema version, record size, symbol, timeframe) followed by
+    fixed-width little-endian records of COLUMNS. Only bars newer than the last written one are
+    appended, so each flush costs the number of bars closed since the previous one regardless of
+    history size. The segment is opened for each write and closed after it (writes come once a minute,
+    and a handle kept per symbol and timeframe adds up to thousands of descriptors). Writes are flushed
+    to the OS on every call and fsynced at most every fsync_interval seconds (0 fsyncs every write),
+    and always before the writer moves on to the next day's segment.
+    """
+    def __init__(self, directory: str, symbol: str, timeframe: str, fsync_interval: float = 60.0,
+                 last_time: int = None):
+        self.directory = directory
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.fsync_interval = fsync_interval
+        self.last_time = last_time  # time (epoch ms) of the newest bar already on disk
+        self._day = None  # day of the segment checked by _open_segment
+        self._unsynced = None  # path of the segment written since the last fsync
+        self._last_fsync = time.monotonic()
+
+    def _open_segment(self, day: int):
+        """Opens the day's segment for appending, creating it or (once per day) cutting a torn record."""
+        path = os.path.join(self.directory, segment_name(day))
+        if self._day == day and os.path.exists(path):
+            return open(path, 'ab')
+        self.sync()
+        os.makedirs(self.directory, exist_ok=True)
+        if os.path.exists(path) and os.path.getsize(path) >= HEADER.size:
+            upgrade_segment(path)
+            # A crash can leave a torn last record; cut it so appends stay aligned
+            size = os.path.getsize(path)
+            whole = HEADER.size + (size - HEADER.size) // RECORD.itemsize * RECORD.itemsize
+            if whole != size:
+                os.truncate(path, whole)
+            f = open(path, 'ab')
+        else:
+            f = open(path, 'wb')
+            f.write(HEADER.pack(MAGIC, SCHEMA_VERSION, RECORD.itemsize,
+                                self.symbol.encode(), self.timeframe.encode()))
+        self._day = day
+        return f
+
+    def collect(self, store):
+        """Copies the bars of store closed since the last write into RECORD rows (cheap, no I/O)."""
+        start, stop = store.index_range(None if self.last_time is None else self.last_time + 1, None)
+        columns = store.slice(start, stop)
+        records = np.empty(stop - start, dtype=RECORD)
+        for name in COLUMNS:
+            records[name] = columns[name]
+        return records
+
+    def write_records(self, records):
+        """Appends rows returned by collect; safe to run off the thread that feeds the store."""
+        if not len(records):
+            return 0
+        days = records['time'] // DAY_MS
+        bounds = [0, *(np.flatnonzero(np.diff(days)) + 1), len(records)]
+        try:
+            for begin, end in zip(bounds[:-1], bounds[1:]):
+                with self._open_segment(int(days[begin])) as f:
+                    f.write(records[begin:end].tobytes())
+                self._unsynced = f.name
+        except OSError:
+            self._day = None  # check the segment again on the next write, cutting what this one tore
+            raise
+        self.last_time = int(records['time'][-1])
+        if time.monotonic() - self._last_fsync >= self.fsync_interval:
+            self.sync()
+        return len(records)
+
+    def collect_times(self, store, times):
+        """Copies the bars of store starting at times (epoch ms) into RECORD rows, skipping unknown ones."""
+        times = np.asarray(sorted(times), dtype=np.int64)
+        stored = store.column('time')
+        indices = np.searchsorted(stored, times)
+        found = indices < len(stored)
+        found[found] = stored[indices[found]] == times[found]
+        columns = store.take(indices[found])
+        records = np.empty(int(found.sum()), dtype=RECORD)
+        for name in COLUMNS:
+            records[name] = columns[name]
+        records['time'] = times[found]
+        return records
+
+    def revise(self, records):
+        """Writes revised bars over the on-disk ones with the same times, in place.
+
+        Bars missing from a segment (inserted in memory by late trades) are merged into it, rewriting the
+        segment atomically; bars newer than last_time are left to write_records().
+        """
+        records = records[records['time'] <= (self.last_time if self.last_time is not None else -1)]
+        for day in np.unique(records['time'] // DAY_MS):
+            day_records = records[records['time'] // DAY_MS == day]
+            path = os.path.join(self.directory, segment_name(int(day)))
+            if os.path.exists(path):
+                upgrade_segment(path)
+                times = np.array(open_records(path)['time'])
+            else:
+                times = np.empty(0, dtype=np.int64)
+            indices = np.searchsorted(times, day_records['time'])
+            found = indices < len(times)
+            found[found] = times[indices[found]] == day_records['time'][found]
+            if found.all():
+                with open(path, 'r+b') as f:
+                    for index, record in zip(indices.tolist(), day_records):
+                        f.seek(HEADER.size + index * RECORD.itemsize)
+                        f.write(record.tobytes())
+            else:
+                self._rewrite_segment(int(day), path, day_records)
+
+    def _rewrite_segment(self, day: int, path: str, records):
+        """Merges records into a segment by time (records win) and replaces it atomically."""
+        existing = np.array(open_records(path)) if os.path.exists(path) else np.empty(0, dtype=RECORD)
+        existing = existing[~np.isin(existing['time'], records['time'])]
+        merged = np.concatenate((existing, records))
+        merged = merged[np.argsort(merged['time'], kind='stable')]
+        os.makedirs(self.directory, exist_ok=True)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(HEADER.pack(MAGIC, SCHEMA_VERSION, RECORD.itemsize, self.symbol.encode(), self.timeframe.encode()))
+            f.write(merged.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + '.tmp', path)
+
+    def sync(self):
+        if self._unsynced is not None and os.path.exists(self._unsynced):
+            with open(self._unsynced, 'ab') as f:
+                os.fsync(f.fileno())
+        self._unsynced = None
+        self._last_fsync = time.monotonic()
+
+    def close(self):
+        self.sync()
+        self._day = None
+
+def segment_paths(directory: str, since: int = None):
+    """Paths of a timeframe's day segments, oldest first; since (epoch ms) skips days entirely before it."""
+    if not os.path.isdir(directory):
+        return []
+    names = sorted(name for name in os.listdir(directory) if name.endswith('.bin'))
+    if since is not None:
+        first = segment_name(since // DAY_MS)
+        names = [name for name in names if name >= first]
+    return [os.path.join(directory, name) for name in names]
+
+def newest_time(directory: str):
+    """Time (epoch ms) of the newest bar on disk for a timeframe, however old, or None."""
+    for path in reversed(segment_paths(directory)):
+        records = open_records(path)
+        if len(records):
+            return int(records['time'][-1])
+    return None
+
+def read_segments(directory: str, since: int = None):
+    """Memory-mapped records of each day segment, oldest first."""
+    return [open_records(path) for path in segment_paths(directory, since)]
+
+def read_range(directory: str, from_time: int = None, to_time: int = None, limit: int = None):
+    """The newest (up to limit) bars on disk with from_time <= time <= to_time (epoch ms), oldest first.
+
+    Segments are walked newest first and each one is binary searched, so only the returned records
+    are copied out of the memory maps.
+    """
+    chunks = []
+    remaining = limit
+    last = None if to_time is None else segment_name(to_time // DAY_MS)
+    for path in reversed(segment_paths(directory, from_time)):
+        if last is not None and os.path.basename(path) > last:
+            continue
+        records = open_records(path)
+        times = records['time']
+        start = 0 if from_time is None else int(np.searchsorted(times, from_time, side='left'))
+        stop = len(records) if to_time is None else int(np.searchsorted(times, to_time, side='right'))
+        if remaining is not None:
+            start = max(start, stop - remaining)
+        if start < stop:
+            chunks.append(np.array(records[start:stop]))
+            if remaining is not None:
+                remaining -= stop - start
+                if remaining <= 0:
+                    break
+    chunks.reverse()
+    return np.concatenate(chunks) if chunks else np.empty(0, dtype=RECORD)
+
+def export_csv(directory: str, out):
+    """Writes every segment of a timeframe as one human-readable CSV."""
+    out.write(','.join(COLUMNS) + '\n')
+    for records in read_segments(directory):
+        df = pd.DataFrame({name: records[name] for name in COLUMNS})
+        # Keep the milliseconds of sub-second timeframes
+        date_format = '%Y-%m-%d %H:%M:%S.%f' if (records['time'] % 1000).any() else '%Y-%m-%d %H:%M:%S'
+        df['time'] = pd.to_datetime(df['time'], unit='ms')
+        df.to_csv(out, header=False, index=False, date_format=date_format)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Export binary candle segments to CSV")
+    parser.add_argument('directory', help="timeframe directory, e.g. data/1m")
+    parser.add_argument('-o', '--output', help="CSV file to write (default: stdout)")
+    args = parser.parse_args()
+    if args.output:
+        with open(args.output, 'w', newline='') as out:
+            export_csv(args.directory, out)
+    else:
+        export_csv(args.directory, sys.stdout)
@@ -0,0 +1,259 @@
+import numpy as np
+
+COLUMNS = ('time', 'open', 'high', 'low', 'close', 'volume', 'notional', 'trades', 'buy_volume', 'sell_volume')
+DTYPES = {
+    'time': np.int64,  # bar start, epoch milliseconds
+    'open': np.float64,
+    'high': np.float64,
+    'low': np.float64,
+    'close': np.float64,
+    'volume': np.float64,  # traded size
+    'notional': np.float64,  # sum of price * size, so VWAP = notional / volume
+    'trades': np.int64,
+    'buy_volume': np.float64,  # size of taker buys
+    'sell_volume': np.float64,  # size of taker sells
+}
+# Columns that add up when bars (or trades) are merged
+TOTALS = ('volume', 'notional', 'trades', 'buy_volume', 'sell_volume')
+
+def columns_to_bars(columns):
+    """Lightweight Charts bar dicts (time in epoch seconds) from column arrays or a structured array."""
+    names = [name for name in COLUMNS if name != 'time']
+    return [
+        dict(zip(COLUMNS, values))
+        for values in zip((columns['time'] / 1000).tolist(), *(columns[name].tolist() for name in names))
+    ]
+
+class CandleStore:
+    """Time-sorted OHLCV bars kept as one typed numpy array per column.
+
+    Unbounded stores grow by doubling, so appends are amortized O(1). With max_bars the store is a
+    fixed-capacity ring buffer of max_bars rows; reads of a window that wraps around the end of the
+    ring concatenate its two parts, every other slice is a view. With max_age (epoch ms) bars older
+    than the newest bar minus max_age are dropped as new bars arrive.
+    Slices by index or by time range return column arrays instead of per-bar dicts.
+    """
+    def __init__(self, capacity: int = 1024, max_bars: int = None, max_age: int = None):
+        if max_bars is not None and max_bars < 1:
+            raise ValueError("max_bars must be at least 1")
+        self.max_bars = max_bars
+        self.max_age = max_age
+        self._head = 0
+        self._size = 0
+        length = max_bars if max_bars is not None else capacity
+        self._columns = {name: np.empty(length, dtype=dtype) for name, dtype in DTYPES.items()}
+
+    def __len__(self):
+        return self._size
+
+    def _reserve(self, size: int):
+        capacity = len(self._columns['time'])
+        if self._head + size <= capacity:
+            return
+        while capacity < size:
+            capacity = max(capacity * 2, 1)
+        live = slice(self._head, self._head + self._size)
+        for name, column in self._columns.items():
+            grown = np.empty(capacity, dtype=column.dtype)
+            grown[:self._size] = column[live]
+            self._columns[name] = grown
+        self._head = 0
+
+    def _index(self, i: int):
+        """Position in the column arrays of bar i (0 is the oldest)."""
+        i += self._head
+        return i if self.max_bars is None or i < self.max_bars else i - self.max_bars
+
+    def _parts(self, start: int, stop: int):
+        """The one or two position slices holding bars[start:stop], oldest first."""
+        start, stop = self._head + start, self._head + stop
+        if self.max_bars is None or stop <= self.max_bars:
+            return [slice(start, stop)]
+        if start >= self.max_bars:
+            return [slice(start - self.max_bars, stop - self.max_bars)]
+        return [slice(start, self.max_bars), slice(0, stop - self.max_bars)]
+
+    def time_at(self, i: int):
+        """Start (epoch ms) of bar i; negative i counts from the newest, like list indexing."""
+        if not -self._size <= i < self._size:
+            raise IndexError("bar index out of range")
+        return int(self._columns['time'][self._index(i % self._size)])
+
+    def _search(self, time: int, side: str = 'left'):
+        """searchsorted over the stored times, without copying a wrapped ring."""
+        times = self._columns['time']
+        index = 0
+        for part in self._parts(0, self._size):
+            found = int(np.searchsorted(times[part], time, side=side))
+            index += found
+            if found < part.stop - part.start:
+                break
+        return index
+
+    def _evict_expired(self):
+        if self.max_age is None or not self._size:
+            return
+        expired = self._search(self.time_at(self._size - 1) - self.max_age)
+        if expired:
+            self._head = self._index(expired) if self.max_bars is not None else self._head + expired
+            self._size -= expired
+
+    def append(self, time: int, open: float, high: float, low: float, close: float, volume: float = 0.0,
+               notional: float = 0.0, trades: int = 0, buy_volume: float = 0.0, sell_volume: float = 0.0):
+        columns = self._columns
+        if self.max_bars is None:
+            self._reserve(self._size + 1)
+            i = self._head + self._size
+        elif self._size == self.max_bars:
+            i = self._head  # overwrite the oldest bar
+            self._head = self._index(1)
+            self._size -= 1
+        else:
+            i = self._index(self._size)
+        columns['time'][i] = time
+        columns['open'][i] = open
+        columns['high'][i] = high
+        columns['low'][i] = low
+        columns['close'][i] = close
+        columns['volume'][i] = volume
+        columns['notional'][i] = notional
+        columns['trades'][i] = trades
+        columns['buy_volume'][i] = buy_volume
+        columns['sell_volume'][i] = sell_volume
+        self._size += 1
+        self._evict_expired()
+
+    def extend(self, columns):
+        """Appends many bars at once from a mapping of column name -> array-like (missing totals are 0)."""
+        count = len(columns['time'])
+        values = {name: np.asarray(columns[name] if name in columns else np.zeros(count), dtype=dtype)
+                  for name, dtype in DTYPES.items()}
+        if self.max_bars is None:
+            self._reserve(self._size + count)
+            for name, column in self._columns.items():
+                start = self._head + self._size
+                column[start:start + count] = values[name]
+            self._size += count
+        else:
+            if count > self.max_bars:
+                values = {name: value[-self.max_bars:] for name, value in values.items()}
+                count = self.max_bars
+            positions = (self._head + self._size + np.arange(count)) % self.max_bars
+            for name, column in self._columns.items():
+                column[positions] = values[name]
+            overflow = max(0, self._size + count - self.max_bars)
+            self._head = (self._head + overflow) % self.max_bars
+            self._size += count - overflow
+        self._evict_expired()
+
+    def insert(self, time: int, open: float, high: float, low: float, close: float, volume: float = 0.0,
+               notional: float = 0.0, trades: int = 0, buy_volume: float = 0.0, sell_volume: float = 0.0):
+        """Inserts a bar at its place by time (epoch ms), e.g. one created by a late trade.
+
+        Bars after it are shifted by one, so inserting near the newest bar is cheap. Returns False, and
+        stores nothing, when the bar is older than what max_age or a full ring keeps.
+        """
+        index = self._search(time)
+        if index == self._size:
+            self.append(time, open, high, low, close, volume, notional, trades, buy_volume, sell_volume)
+            return True
+        if self.max_age is not None and time < self.time_at(-1) - self.max_age:
+            return False
+        if self._size == self.max_bars:
+            if index == 0:
+                return False
+            self._head = self._index(1)  # make room by dropping the oldest bar
+            self._size -= 1
+            index -= 1
+        if self.max_bars is None:
+            self._reserve(self._size + 1)
+        positions = self._head + np.arange(index, self._size)
+        if self.max_bars is not None:
+            positions %= self.max_bars
+        shifted = positions + 1 if self.max_bars is None else (positions + 1) % self.max_bars
+        values = (time, open, high, low, close, volume, notional, trades, buy_volume, sell_volume)
+        i = self._index(index)
+        for name, value in zip(COLUMNS, values):
+            column = self._columns[name]
+            column[shifted] = column[positions]
+            column[i] = value
+        self._size += 1
+        return True
+
+    def _position(self, time: int):
+        """Position in the column arrays of the bar starting at time (epoch ms), or None when there is none."""
+        index = self._search(time)
+        if index == self._size or self.time_at(index) != time:
+            return None
+        return self._index(index)
+
+    def bar(self, time: int):
+        """The stored bar starting at time (epoch ms) as a Lightweight Charts dict, or None."""
+        i = self._position(time)
+        if i is None:
+            return None
+        return columns_to_bars({name: column[i:i + 1] for name, column in self._columns.items()})[0]
+
+    def revise(self, time: int, price: float, size: float = 0.0, side: int = 0):
+        """Adds a late trade (side 1 buy, -1 sell) to the stored bar starting at time (epoch ms).
+
+        Returns the revised bar as a Lightweight Charts dict, or None when no bar starts at time.
+        """
+        i = self._position(time)
+        if i is None:
+            return None
+        columns = self._columns
+        columns['high'][i] = max(columns['high'][i], price)
+        columns['low'][i] = min(columns['low'][i], price)
+        columns['volume'][i] += size
+        columns['notional'][i] += price * size
+        columns['trades'][i] += 1
+        if side > 0:
+            columns['buy_volume'][i] += size
+        elif side < 0:
+            columns['sell_volume'][i] += size
+        return self.bar(time)
+
+    def replace(self, time: int, values):
+        """Overwrites the given columns of the stored bar starting at time (epoch ms); False when there is none."""
+        i = self._position(time)
+        if i is None:
+            return False
+        for name, value in values.items():
+            self._columns[name][i] = value
+        return True
+
+    def column(self, name: str):
+        """The live bars of one column: a view, or a copy when the ring wraps around."""
+        return self._read(self._columns[name], 0, self._size)
+
+    def _read(self, column, start, stop):
+        parts = self._parts(start, stop)
+        return column[parts[0]] if len(parts) == 1 else np.concatenate([column[part] for part in parts])
+
+    def slice(self, start=None, stop=None):
+        """Returns {column: array} for bars[start:stop]; views unless the range wraps around the ring."""
+        start, stop, _ = slice(start, stop).indices(self._size)
+        stop = max(start, stop)
+        return {name: self._read(column, start, stop) for name, column in self._columns.items()}
+
+    def take(self, indices):
+        """Returns {column: array} of the bars at the given indices (0 is the oldest)."""
+        positions = self._head + np.asarray(indices, dtype=np.int64)
+        if self.max_bars is not None:
+            positions %= self.max_bars
+        return {name: column[positions] for name, column in self._columns.items()}
+
+    def index_range(self, from_time=None, to_time=None):
+        """Returns the (start, stop) indices of bars with from_time <= time <= to_time (epoch ms)."""
+        start = 0 if from_time is None else self._search(from_time, 'left')
+        stop = self._size if to_time is None else self._search(to_time, 'right')
+        return start, max(start, stop)
+
+    def to_records(self, start=None, stop=None):
+        """Bars[start:stop] as Lightweight Charts dicts with time in epoch seconds."""
+        return columns_to_bars(self.slice(start, stop))
+
+    def extend_records(self, records):
+        """Appends bars from a structured array (e.g. a memory-mapped segment) with COLUMNS fields."""
+        self.extend({name: records[name] for name in COLUMNS if name in records.dtype.names})
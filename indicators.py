@@ -0,0 +1,180 @@
+from collections import deque
+
+class SMA:
+    """Simple moving average of closes over the last window bars, from a running sum."""
+    def __init__(self, window: int, name: str = None):
+        self.window = window
+        self.name = name or f'sma_{window}'
+        self._closes = deque()
+        self._sum = 0.0
+
+    def _value(self, total, count):
+        return total / self.window if count >= self.window else None
+
+    def update(self, bar):
+        close = bar['close']
+        self._closes.append(close)
+        self._sum += close
+        if len(self._closes) > self.window:
+            self._sum -= self._closes.popleft()
+        return {self.name: self._value(self._sum, len(self._closes))}
+
+    def peek(self, bar):
+        total = self._sum + bar['close']
+        count = len(self._closes) + 1
+        if count > self.window:
+            total -= self._closes[0]
+        return {self.name: self._value(total, count)}
+
+class EMA:
+    """Exponential moving average (span window, seeded with the first value), like pandas ewm(adjust=False).
+
+    Works on plain floats so other indicators can smooth their own series; None inputs are skipped.
+    """
+    def __init__(self, window: int = None, alpha: float = None):
+        self.alpha = alpha if alpha is not None else 2 / (window + 1)
+        self.min_periods = window or 0
+        self.value = None
+        self.count = 0
+
+    def _next(self, x):
+        return x if self.value is None else self.value + self.alpha * (x - self.value)
+
+    def update(self, x):
+        if x is not None:
+            self.value = self._next(x)
+            self.count += 1
+        return self.value if self.count >= self.min_periods else None
+
+    def peek(self, x):
+        if x is None:
+            return self.value if self.count >= self.min_periods else None
+        return self._next(x) if self.count + 1 >= self.min_periods else None
+
+class RSI:
+    """Relative strength index with Wilder smoothing (alpha = 1 / window) of gains and losses."""
+    def __init__(self, window: int = 14, name: str = 'rsi'):
+        self.name = name
+        self._gain = EMA(alpha=1 / window)
+        self._loss = EMA(alpha=1 / window)
+        self._gain.min_periods = self._loss.min_periods = window
+        self._previous = None
+
+    @staticmethod
+    def _rsi(gain, loss):
+        if gain is None or loss is None:
+            return None
+        return 100.0 if loss == 0 else 100 - 100 / (1 + gain / loss)
+
+    def update(self, bar):
+        close = bar['close']
+        # The first bar counts as no change, as in the ta library
+        change = 0.0 if self._previous is None else close - self._previous
+        self._previous = close
+        return {self.name: self._rsi(self._gain.update(max(change, 0.0)), self._loss.update(max(-change, 0.0)))}
+
+    def peek(self, bar):
+        change = 0.0 if self._previous is None else bar['close'] - self._previous
+        return {self.name: self._rsi(self._gain.peek(max(change, 0.0)), self._loss.peek(max(-change, 0.0)))}
+
+class MACD:
+    """MACD line (fast EMA - slow EMA), its signal EMA and their difference."""
+    def __init__(self, fast: int = 12, slow: int = 26, signal: int = 9, prefix: str = 'macd'):
+        self.prefix = prefix
+        self._fast = EMA(fast)
+        self._slow = EMA(slow)
+        self._signal = EMA(signal)
+
+    def _values(self, macd, signal):
+        return {
+            self.prefix: macd,
+            f'{self.prefix}_signal': signal,
+            f'{self.prefix}_histogram': None if macd is None or signal is None else macd - signal,
+        }
+
+    @staticmethod
+    def _difference(fast, slow):
+        return None if fast is None or slow is None else fast - slow
+
+    def update(self, bar):
+        macd = self._difference(self._fast.update(bar['close']), self._slow.update(bar['close']))
+        return self._values(macd, self._signal.update(macd))
+
+    def peek(self, bar):
+        macd = self._difference(self._fast.peek(bar['close']), self._slow.peek(bar['close']))
+        return self._values(macd, self._signal.peek(macd))
+
+class VWAP:
+    """Volume-weighted average price of the last window bars, from their traded notional and volume."""
+    def __init__(self, window: int = 14, name: str = 'vwap'):
+        self.window = window
+        self.name = name
+        self._bars = deque()
+        self._notional = 0.0
+        self._volume = 0.0
+
+    def _value(self, notional, volume, count):
+        return notional / volume if count >= self.window and volume > 0 else None
+
+    def update(self, bar):
+        self._bars.append((bar['notional'], bar['volume']))
+        self._notional += bar['notional']
+        self._volume += bar['volume']
+        if len(self._bars) > self.window:
+            notional, volume = self._bars.popleft()
+            self._notional -= notional
+            self._volume -= volume
+        return {self.name: self._value(self._notional, self._volume, len(self._bars))}
+
+    def peek(self, bar):
+        notional = self._notional + bar['notional']
+        volume = self._volume + bar['volume']
+        count = len(self._bars) + 1
+        if count > self.window:
+            notional -= self._bars[0][0]
+            volume -= self._bars[0][1]
+        return {self.name: self._value(notional, volume, count)}
+
+def default_indicators():
+    """The indicators misc/flaskresampler.py draws, with the same names."""
+    return [SMA(12), SMA(24), SMA(50), SMA(200), RSI(14), MACD(12, 26, 9), VWAP(14)]
+
+class IndicatorSet:
+    """Indicators of one timeframe's live bars, each updated in constant time per bar.
+
+    observe() takes the bars touched by aggregation: when the open bar is replaced, the previous
+    one is final and is committed to every indicator; the open bar only gets provisional values,
+    computed from the committed state without changing it. Values land in each bar's 'indicators'
+    dict, so they travel with the bar to the charts.
+    """
+    def __init__(self, indicators=None):
+        self.indicators = default_indicators() if indicators is None else indicators
+        self._open = None
+
+    def update(self, bar):
+        """Commits a closed bar and returns its indicator values."""
+        values = {}
+        for indicator in self.indicators:
+            values.update(indicator.update(bar))
+        return values
+
+    def peek(self, bar):
+        """Indicator values if the open bar closed now."""
+        values = {}
+        for indicator in self.indicators:
+            values.update(indicator.peek(bar))
+        return values
+
+    def observe(self, bars):
+        """Takes touched bars, oldest first, as returned by ChartData.update_from_ticks."""
+        for bar in bars:
+            if self._open is not None and bar is not self._open:
+                self._open['indicators'] = self.update(self._open)
+            self._open = bar
+        if bars:
+            self._open['indicators'] = self.peek(self._open)
+
+    def warm_up(self, bars):
+        """Commits closed history (e.g. the bars loaded at startup) before any live update."""
+        for bar in bars:
+            self.update(bar)
@@ -0,0 +1,315 @@
+import argparse
+import io
+import os
+import struct
+
+import numpy as np
+import pandas as pd
+
+SCAN_BYTES = 64 * 1024 * 1024  # bytes read at a time when indexing the lines of a CSV
+CSV_CHUNK_ROWS = 500_000  # rows parsed at a time when indexing the times of a CSV
+
+INDEX_MAGIC = b'BIDX'
+INDEX_VERSION = 1
+# magic, version, time column, then the size, mtime (ns), inode and row count of the CSV it indexes
+INDEX_HEADER = struct.Struct('<4sH26s4q')
+INDEX_ROW = np.dtype([('time', '<i8'), ('offset', '<i8')])
+
+def series_keys(values):
+    """Sortable int64 keys of bar times: numbers as they are, timestamps as UTC epoch ns."""
+    values = pd.Series(values)
+    if pd.api.types.is_numeric_dtype(values):
+        return values.to_numpy(dtype=np.int64)
+    return pd.DatetimeIndex(pd.to_datetime(values, utc=True, format='ISO8601')).as_unit('ns').asi8
+
+def header_names(columns):
+    """Column names to write; the unnamed index column pandas reads back as 'Unnamed: 0' stays blank."""
+    return ['' if str(column).startswith('Unnamed: ') else column for column in columns]
+
+def line_ends(f, start, stop):
+    """Offsets just past every newline of f between start and stop."""
+    ends = []
+    f.seek(start)
+    position = start
+    while position < stop:
+        block = np.frombuffer(f.read(min(SCAN_BYTES, stop - position)), dtype=np.uint8)
+        ends.append(np.flatnonzero(block == ord('\n')) + position + 1)
+        position += len(block)
+    return np.concatenate(ends) if ends else np.empty(0, dtype=np.int64)
+
+def same_rows(old, new, header, time_column):
+    """Whether each parsed old row holds the same values as the new row at the same place."""
+    same = np.ones(len(old), dtype=bool)
+    for column in header:
+        if column == time_column:
+            continue
+        try:
+            a, b = old[column].to_numpy(dtype=np.float64), new[column].to_numpy(dtype=np.float64)
+            same &= (a == b) | (np.isnan(a) & np.isnan(b))
+        except (TypeError, ValueError):
+            same &= old[column].astype(str).to_numpy() == new[column].astype(str).to_numpy()
+    return same
+
+class BarSeries:
+    """A bar CSV kept sorted by, and unique in, its time column, with an index of its rows.
+
+    The index (the key and byte offset of every row) lives in memory and in a <csv>.idx sidecar of 16
+    bytes per row. Opening a series reads the sidecar when its recorded size, mtime and inode still match
+    the CSV and rebuilds it with a full scan otherwise. upsert() binary searches the index, so a batch
+    costs O(m log n) plus the bytes it writes. Rows newer than the last one are appended (extending the
+    sidecar), identical rows are skipped, and only a batch that changes or inserts older rows rewrites
+    the file from the first affected row on (atomically, via a .tmp copy). A line torn by a crash is
+    cut on open, like the torn records of candle segments.
+    """
+    def __init__(self, path: str, time_column: str = 'time'):
+        self.path = path
+        self.index_path = path + '.idx'
+        self.time_column = time_column
+        self.header = None
+        self._rows = 0
+        self._times = np.empty(1024, dtype=np.int64)  # keys of the rows, strictly increasing
+        self._offsets = np.empty(1024, dtype=np.int64)  # byte offset of each row's line
+        self._size = 0  # end of the last complete line
+        if os.path.exists(path) and os.path.getsize(path):
+            self._load()
+
+    def __len__(self):
+        return self._rows
+
+    @property
+    def times(self):
+        return self._times[:self._rows]
+
+    def _load(self):
+        if self._read_index():
+            self.header = pd.read_csv(self.path, nrows=0).columns.tolist()
+            return
+        size = os.path.getsize(self.path)
+        with open(self.path, 'rb') as f:
+            ends = line_ends(f, 0, size)
+        if not len(ends):
+            raise ValueError(f"{self.path} has no complete header line")
+        if ends[-1] != size:
+            os.truncate(self.path, ends[-1])
+        self.header = pd.read_csv(self.path, nrows=0).columns.tolist()
+        if self.time_column not in self.header:
+            raise ValueError(f"{self.path} has no {self.time_column} column")
+        keys = [series_keys(chunk[self.time_column])
+                for chunk in pd.read_csv(self.path, usecols=[self.time_column], chunksize=CSV_CHUNK_ROWS,
+                                         skip_blank_lines=False)]
+        keys = np.concatenate(keys) if keys else np.empty(0, dtype=np.int64)
+        if len(keys) != len(ends) - 1:
+            raise ValueError(f"{self.path} has blank or multi-line rows")
+        if (np.diff(keys) <= 0).any():
+            raise ValueError(f"{self.path} is not sorted by unique {self.time_column}; compact it first")
+        self._set_rows(keys, ends[:-1], int(ends[-1]))
+        self._write_index()
+
+    def _index_header(self):
+        stat = os.stat(self.path)
+        return INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, self.time_column.encode(), stat.st_size,
+                                 stat.st_mtime_ns, stat.st_ino, self._rows)
+
+    def _read_index(self):
+        """Loads the sidecar index if it was written for the CSV as it is now; False otherwise."""
+        try:
+            with open(self.index_path, 'rb') as f:
+                header = f.read(INDEX_HEADER.size)
+                if len(header) != INDEX_HEADER.size:
+                    return False
+                magic, version, time_column, size, mtime_ns, inode, rows = INDEX_HEADER.unpack(header)
+                stat = os.stat(self.path)
+                if (magic, version, time_column.rstrip(b'\0'), size, mtime_ns, inode) != \
+                        (INDEX_MAGIC, INDEX_VERSION, self.time_column.encode()[:26], stat.st_size, stat.st_mtime_ns,
+                         stat.st_ino):
+                    return False
+                index = np.fromfile(f, dtype=INDEX_ROW, count=rows)
+        except OSError:
+            return False
+        if len(index) != rows:
+            return False
+        self._set_rows(index['time'], index['offset'], size)
+        return True
+
+    def _write_index(self):
+        """Writes the whole sidecar index atomically."""
+        index = np.empty(self._rows, dtype=INDEX_ROW)
+        index['time'], index['offset'] = self.times, self._offsets[:self._rows]
+        with open(self.index_path + '.tmp', 'wb') as f:
+            f.write(self._index_header())
+            f.write(index.tobytes())
+        os.replace(self.index_path + '.tmp', self.index_path)
+
+    def _extend_index(self, start):
+        """Adds the rows from start on to the sidecar index. The rows go to disk before the header that
+        makes them valid; a crash in between leaves a stale header, which the next open rebuilds."""
+        if not os.path.exists(self.index_path):
+            self._write_index()
+            return
+        index = np.empty(self._rows - start, dtype=INDEX_ROW)
+        index['time'], index['offset'] = self._times[start:self._rows], self._offsets[start:self._rows]
+        with open(self.index_path, 'r+b') as f:
+            f.seek(INDEX_HEADER.size + start * INDEX_ROW.itemsize)
+            f.write(index.tobytes())
+            f.truncate()
+            f.flush()
+            os.fsync(f.fileno())
+            f.seek(0)
+            f.write(self._index_header())
+
+    def _set_rows(self, times, offsets, size, start=0):
+        """Replaces the index from row start on."""
+        rows = start + len(times)
+        if rows > len(self._times):
+            capacity = max(len(self._times), 1)
+            while capacity < rows:
+                capacity *= 2
+            self._times = np.concatenate([self._times[:start], np.empty(capacity - start, dtype=np.int64)])
+            self._offsets = np.concatenate([self._offsets[:start], np.empty(capacity - start, dtype=np.int64)])
+        self._times[start:rows] = times
+        self._offsets[start:rows] = offsets
+        self._rows = rows
+        self._size = size
+
+    def _create(self, columns):
+        self.header = list(columns)
+        with open(self.path, 'w', newline='') as f:
+            pd.DataFrame(columns=header_names(self.header)).to_csv(f, index=False, lineterminator='\n')
+        self._set_rows([], [], os.path.getsize(self.path))
+        self._write_index()
+
+    def _format(self, frame):
+        """CSV lines of frame's rows in the file's column order; columns the file lacks are an error."""
+        extra = [column for column in frame.columns if column not in self.header]
+        if extra:
+            raise ValueError(f"{self.path} has no column(s) {extra}")
+        text = frame.reindex(columns=self.header).to_csv(header=False, index=False, lineterminator='\n')
+        return np.array(text.encode().splitlines(keepends=True), dtype=object)
+
+    def _parse(self, lines):
+        return pd.read_csv(io.BytesIO(b''.join(lines)), names=self.header, header=None)
+
+    def _read_lines(self, indices):
+        lines = []
+        with open(self.path, 'rb') as f:
+            for i in indices:
+                end = self._offsets[i + 1] if i + 1 < self._rows else self._size
+                f.seek(self._offsets[i])
+                lines.append(f.read(end - self._offsets[i]))
+        return lines
+
+    def upsert(self, frame):
+        """Writes the bars of frame keyed by their time column (or index): new times are added, existing
+        ones replaced when any value differs. A time repeated within frame keeps its last row.
+
+        Returns the number of rows appended, inserted, updated and left unchanged.
+        """
+        if self.time_column not in frame.columns:
+            frame = frame.reset_index()
+        counts = dict.fromkeys(('appended', 'inserted', 'updated', 'unchanged'), 0)
+        if frame.empty:
+            return counts
+        if self.header is None:
+            self._create(frame.columns)
+        keys = series_keys(frame[self.time_column])
+        order = np.argsort(keys, kind='stable')
+        keys = keys[order]
+        last = np.append(keys[1:] != keys[:-1], True)
+        keys = keys[last]
+        lines = self._format(frame.iloc[order[last]])
+
+        positions = np.searchsorted(self.times, keys)
+        exists = positions < self._rows
+        exists[exists] = self.times[positions[exists]] == keys[exists]
+        changed = exists.copy()
+        if exists.any():
+            old = self._parse(self._read_lines(positions[exists]))
+            changed[exists] = ~same_rows(old, self._parse(lines[exists]), self.header, self.time_column)
+        appended = positions == self._rows
+        inserted = ~exists & ~appended
+        counts.update(appended=int(appended.sum()), inserted=int(inserted.sum()), updated=int(changed.sum()),
+                      unchanged=int((exists & ~changed).sum()))
+
+        if changed.any() or inserted.any():
+            write = changed | ~exists
+            self._rewrite(int(positions[changed | inserted].min()), keys[write], lines[write],
+                          positions[changed])
+        elif appended.any():
+            self._append(keys[appended], lines[appended])
+        return counts
+
+    def _append(self, keys, lines):
+        lengths = np.fromiter((len(line) for line in lines), dtype=np.int64, count=len(lines))
+        with open(self.path, 'ab') as f:
+            f.write(b''.join(lines))
+            f.flush()
+            os.fsync(f.fileno())
+        offsets = self._size + np.cumsum(lengths) - lengths
+        start = self._rows
+        self._set_rows(keys, offsets, self._size + int(lengths.sum()), start)
+        self._extend_index(start)
+
+    def _rewrite(self, first, keys, lines, replaced):
+        """Rewrites the file from row first on with the old rows merged with keys/lines (which replace the
+        old rows at indices replaced)."""
+        start = int(self._offsets[first]) if first < self._rows else self._size
+        kept = np.ones(self._rows - first, dtype=bool)
+        kept[replaced - first] = False
+        old_keys = self.times[first:][kept]
+        old_lines = np.array(self._read_lines(np.arange(first, self._rows)[kept]), dtype=object)
+        keys = np.concatenate([old_keys, keys])
+        lines = np.concatenate([old_lines, lines])
+        order = np.argsort(keys, kind='stable')
+        keys, lines = keys[order], lines[order]
+
+        lengths = np.fromiter((len(line) for line in lines), dtype=np.int64, count=len(lines))
+        with open(self.path, 'rb') as source, open(self.path + '.tmp', 'wb') as f:
+            remaining = start
+            while remaining:
+                block = source.read(min(SCAN_BYTES, remaining))
+                f.write(block)
+                remaining -= len(block)
+            f.write(b''.join(lines))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(self.path + '.tmp', self.path)
+        self._set_rows(keys, start + np.cumsum(lengths) - lengths, start + int(lengths.sum()), first)
+        self._write_index()
+
+def compact(path: str, time_column: str = 'time', names=None, output: str = None):
+    """Rewrites a bar CSV sorted by time_column with one row per time, the last one written winning.
+
+    names gives the columns of a file without a header line (rows with fewer fields are padded).
+    Returns the number of rows before and after.
+    """
+    frame = pd.read_csv(path, header=None if names else 'infer', names=names)
+    before = len(frame)
+    keys = series_keys(frame[time_column])
+    order = np.argsort(keys, kind='stable')
+    last = np.append(keys[order][1:] != keys[order][:-1], True)
+    frame = frame.iloc[order[last]]
+    frame.columns = header_names(frame.columns)
+    output = output or path
+    frame.to_csv(output + '.tmp', index=False, lineterminator='\n')
+    os.replace(output + '.tmp', output)
+    return before, len(frame)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Idempotent bar CSV ingestion keyed by bar time")
+    commands = parser.add_subparsers(dest='command', required=True)
+    upsert = commands.add_parser('upsert', help="upsert the rows of a CSV batch into a series")
+    upsert.add_argument('series', help="series CSV (created when missing)")
+    upsert.add_argument('batch', help="CSV of bars to write")
+    upsert.add_argument('--time-column', default='time')
+    compact_parser = commands.add_parser('compact', help="sort a series and drop rows with repeated times")
+    compact_parser.add_argument('path')
+    compact_parser.add_argument('--time-column', default='time')
+    compact_parser.add_argument('--names', help="comma-separated columns of a file without a header line")
+    compact_parser.add_argument('-o', '--output', help="CSV file to write (default: in place)")
+    args = parser.parse_args()
+    if args.command == 'upsert':
+        print(BarSeries(args.series, args.time_column).upsert(pd.read_csv(args.batch)))
+    else:
+        before, after = compact(args.path, args.time_column, args.names.split(',') if args.names else None,
+                                args.output)
+        print(f"{before} rows -> {after} rows")
@@ -1,7 +1,16 @@
-from flask import Flask, render_template, request, url_for
+from flask import Flask, jsonify, render_template, request, url_for
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from functools import partial
+import hashlib
+import json
 import os
+import shutil
+import sys
+import threading
+import time
 import pandas as pd
-from datetime import timedelta
+from datetime import timedelta, timezone
 import numpy as np
 import ta
 
@@ -10,6 +19,84 @@ app = Flask(__name__)
 # Define the root directory
 ROOT = "/home/acer/Videos/2024dir/00Jul19/data/data"
 
+# Columns calculate_indicators adds; part of the cache key so changing them never serves stale results
+INDICATOR_SET = ('sma_12', 'sma_24', 'sma_50', 'sma_200', 'rsi', 'macd', 'macd_signal', 'macd_histogram', 'vwap')
+
+CACHE_MAX_BYTES = 512 * 1024 * 1024  # estimated memory of the cached chart records
+CSV_CHUNK_ROWS = 500_000  # rows parsed at a time when streaming a CSV into the resampler
+
+# Pre-resampled levels of every CSV in ROOT; each level must evenly divide the next
+PYRAMID_DIR = os.path.join(ROOT, '.pyramid')
+PYRAMID_LEVELS = ('5s', '1min', '5min', '1h', '1D')
+PYRAMID_INTERVAL = 60  # seconds between scans of ROOT for new or grown CSVs
+PYRAMID_HEAD_BYTES = 4096  # leading bytes fingerprinted to tell an appended file from a replaced one
+
+CHART_WORKERS = 4  # panels loaded at once
+CHART_TIMEOUT = 60  # seconds a page waits for its slowest panel
+
+class ResultCache:
+    """LRU of chart records keyed by (path, size, mtime, timeframe, indicator set), bounded by estimated memory.
+
+    A file that is rewritten gets a new size or mtime, so its old entries are never hit again and age out.
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (records, estimated bytes)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(path, timeframe):
+        stat = os.stat(path)
+        return (path, stat.st_size, stat.st_mtime_ns, timeframe, INDICATOR_SET)
+
+    @staticmethod
+    def estimate_bytes(records):
+        """Size of a to_dict('records') list, extrapolated from its first record."""
+        if not records:
+            return sys.getsizeof(records)
+        first = records[0]
+        per_record = sys.getsizeof(first) + sum(sys.getsizeof(value) for value in first.values()) + 8
+        return sys.getsizeof(records) + per_record * len(records)
+
+    def get(self, key, build):
+        """Returns the records cached for key, calling build() on a miss."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            self.misses += 1
+        records = build()
+        size = self.estimate_bytes(records)
+        with self._lock:
+            if key not in self._entries and size <= self.max_bytes:
+                self._entries[key] = (records, size)
+                self.bytes += size
+                while self.bytes > self.max_bytes:
+                    _, (_, evicted) = self._entries.popitem(last=False)
+                    self.bytes -= evicted
+                    self.evictions += 1
+        return records
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else None,
+            }
+
+result_cache = ResultCache(CACHE_MAX_BYTES)
+
 def calculate_indicators(df):
     """
     Calculates technical indicators for a given DataFrame.
@@ -30,8 +117,10 @@ def calculate_indicators(df):
     df['macd_signal'] = ta.trend.macd_signal(df['close'], window_slow=26, window_fast=12, window_sign=9, fillna=False)
     df['macd_histogram'] = ta.trend.macd_diff(df['close'], window_slow=26, window_fast=12, window_sign=9, fillna=False)
 
-    # Calculate VWAP
-    if 'volume' in df.columns and df['volume'].sum() > 0:
+    # Calculate VWAP; bars exported by updateFromTickFinal carry the exact traded notional
+    if 'notional' in df.columns and df['volume'].sum() > 0:
+        df['vwap'] = df['notional'].rolling(window=14).sum() / df['volume'].rolling(window=14).sum()
+    elif 'volume' in df.columns and df['volume'].sum() > 0:
         typical_price = (df['high'] + df['low'] + df['close']) / 3
         df['vwap'] = (typical_price * df['volume']).rolling(window=14).sum() / df['volume'].rolling(window=14).sum()
     else:
@@ -39,30 +128,371 @@ def calculate_indicators(df):
 
     return df
 
-def resample_and_indicators(df, timeframe):
+SUM_COLUMNS = ('volume', 'notional', 'trades', 'buy_volume', 'sell_volume')
+DAY_NS = 86_400 * 10**9
+
+def resample_pandas(df, timeframe):
+    """Resamples OHLCV rows with pandas; works for every frequency, including calendar ones."""
+    df['time'] = pd.to_datetime(df['time'])
+    df.set_index('time', inplace=True)
+
+    aggregations = {
+        'open': 'first',
+        'high': 'max',
+        'low': 'min',
+        'close': 'last',
+        'volume': 'sum'
+    }
+    for column in SUM_COLUMNS[1:]:
+        if column in df.columns:
+            aggregations[column] = 'sum'
+    return df.resample(timeframe).agg(aggregations).dropna()
+
+def resample_ohlcv(frames, timeframe):
+    """Resamples OHLCV frames (oldest first, rows sorted by time) with numpy segment reductions.
+
+    Bucket ids come from integer division of epoch nanoseconds, aligned to midnight of the first day
+    like pandas' default origin, so the bars match resample_pandas bar for bar. Frames can be chunks of
+    one file: only the still-open last bucket of a chunk is carried into the next, so memory stays
+    bounded by the chunk size. Rows with a missing price are skipped. Raises ValueError for calendar
+    frequencies (months, ...) and for unsorted rows; use resample_pandas for those.
+    """
+    step = pd.tseries.frequencies.to_offset(timeframe).nanos
+    origin = None
+    tz = None
+    sums = None
+    parts = []
+    carry = None  # the last bucket of the previous chunk, which the next chunk may continue
+
+    for df in frames:
+        times = pd.to_datetime(df['time'])
+        if origin is None:
+            tz = times.dt.tz
+            sums = [column for column in SUM_COLUMNS if column in df.columns]
+        if tz is not None:
+            times = times.dt.tz_convert(tz).dt.tz_localize(None)  # bucket on wall-clock time, like pandas
+        ns = times.to_numpy(dtype='datetime64[ns]').view(np.int64)
+        prices = {column: df[column].to_numpy(dtype=np.float64) for column in ('open', 'high', 'low', 'close')}
+        valid = ~(np.isnan(prices['open']) | np.isnan(prices['high']) | np.isnan(prices['low']) | np.isnan(prices['close']))
+        if not valid.all():
+            ns = ns[valid]
+            prices = {column: values[valid] for column, values in prices.items()}
+        if not len(ns):
+            continue
+        if origin is None:
+            origin = ns[0] - ns[0] % DAY_NS
+        buckets = (ns - origin) // step
+        if (np.diff(buckets) < 0).any() or (carry is not None and buckets[0] < carry['bucket'][0]):
+            raise ValueError("rows must be sorted by time")
+
+        starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+        ends = np.r_[starts[1:], len(buckets)] - 1
+        bars = {
+            'bucket': buckets[starts],
+            'open': prices['open'][starts],
+            'high': np.maximum.reduceat(prices['high'], starts),
+            'low': np.minimum.reduceat(prices['low'], starts),
+            'close': prices['close'][ends],
+        }
+        for column in sums:
+            values = np.nan_to_num(df[column].to_numpy(dtype=np.float64))
+            bars[column] = np.add.reduceat(values[valid] if not valid.all() else values, starts)
+
+        if carry is not None:
+            if carry['bucket'][0] == bars['bucket'][0]:
+                bars['open'][0] = carry['open'][0]
+                bars['high'][0] = max(bars['high'][0], carry['high'][0])
+                bars['low'][0] = min(bars['low'][0], carry['low'][0])
+                for column in sums:
+                    bars[column][0] += carry[column][0]
+            else:
+                parts.append(carry)
+        parts.append({column: values[:-1] for column, values in bars.items()})
+        carry = {column: values[-1:] for column, values in bars.items()}
+
+    if carry is not None:
+        parts.append(carry)
+    columns = ['open', 'high', 'low', 'close', *sums]
+    if not parts:
+        return pd.DataFrame(columns=columns, index=pd.DatetimeIndex([], name='time'))
+    merged = {column: np.concatenate([part[column] for part in parts]) for column in ['bucket', *columns]}
+    index = pd.DatetimeIndex(origin + merged.pop('bucket') * step, name='time')
+    if tz is not None:
+        index = index.tz_localize(tz)
+    return pd.DataFrame(merged, index=index)
+
+def with_indicators(resampled):
+    """Adds the indicators to resampled bars and turns their time index into a Unix timestamp column."""
+    resampled = calculate_indicators(resampled)
+
+    resampled.reset_index(inplace=True)
+    resampled['time'] = resampled['time'].astype(int) // 10**9  # Unix timestamp
+
+    return resampled
+
+def read_csv_chunks(csv_path, columns, chunk_rows=CSV_CHUNK_ROWS):
+    """Parses only the given columns of a CSV, chunk_rows rows at a time."""
+    with pd.read_csv(csv_path, usecols=columns, chunksize=chunk_rows) as reader:
+        yield from reader
+
+def load_chart_records(csv_path, timeframe):
+    """Resamples a CSV and calculates indicators; None when it lacks the OHLCV columns.
+
+    Timeframes a pyramid level evenly divides are re-aggregated from the coarsest such level. Otherwise
+    the CSV is streamed through the resampler, so only one chunk of rows plus the bars resampled so far
+    are in memory at a time. Files the streaming resampler cannot handle (calendar timeframes, unsorted
+    rows) are read whole and resampled by pandas.
+    """
+    header = pd.read_csv(csv_path, nrows=0).columns
+
+    required_columns = ['time', 'open', 'high', 'low', 'close', 'volume']
+    if not all(col in header for col in required_columns):
+        return None
+    columns = required_columns + [column for column in SUM_COLUMNS[1:] if column in header]
+    frames = pyramid_frames(csv_path, timeframe)
+    try:
+        resampled = resample_ohlcv(frames if frames is not None else read_csv_chunks(csv_path, columns), timeframe)
+    except ValueError:
+        resampled = resample_pandas(pd.read_csv(csv_path, usecols=columns), timeframe)
+    return with_indicators(resampled).to_dict('records')
+
+pyramid_locks = {}  # csv path -> lock held while its levels are written or read
+pyramid_locks_lock = threading.Lock()
+
+def pyramid_lock(csv_path):
+    with pyramid_locks_lock:
+        return pyramid_locks.setdefault(csv_path, threading.Lock())
+
+def pyramid_paths(csv_path):
+    """Sidecar directory of a CSV's levels and its manifest."""
+    directory = os.path.join(PYRAMID_DIR, os.path.basename(csv_path))
+    return directory, os.path.join(directory, 'manifest.json')
+
+def level_dtype(columns):
+    """Fixed-width level record: bar start in wall-clock epoch ns, then the bar columns."""
+    return np.dtype([('time', '<i8')] + [(column, '<f8') for column in columns])
+
+def read_manifest(csv_path):
+    _, manifest_path = pyramid_paths(csv_path)
     try:
-        df['time'] = pd.to_datetime(df['time'])
-        df.set_index('time', inplace=True)
-        
-        resampled = df.resample(timeframe).agg({
-            'open': 'first',
-            'high': 'max',
-            'low': 'min',
-            'close': 'last',
-            'volume': 'sum'
-        }).dropna()
-        
-        # Calculate indicators
-        resampled = calculate_indicators(resampled)
-        
-        resampled.reset_index(inplace=True)
-        resampled['time'] = resampled['time'].astype(int) // 10**9  # Unix timestamp
-        
-        return resampled
-    except Exception as e:
-        print(f"Error in resample_and_indicators: {e}")
-        print(f"DataFrame info:\n{df.info()}")
-        raise
+        with open(manifest_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def head_digest(csv_path, length):
+    with open(csv_path, 'rb') as f:
+        return hashlib.blake2b(f.read(length), digest_size=16).hexdigest()
+
+def complete_length(csv_path, size):
+    """Bytes of the file up to and including its last newline; a line still being appended waits for the next build."""
+    with open(csv_path, 'rb') as f:
+        position = size
+        while position > 0:
+            step = min(65536, position)
+            f.seek(position - step)
+            newline = f.read(step).rfind(b'\n')
+            if newline >= 0:
+                return position - step + newline + 1
+            position -= step
+    return 0
+
+class ByteRange:
+    """Read-only view of bytes [start, stop) of an open binary file, for pandas to parse."""
+    def __init__(self, f, start, stop):
+        f.seek(start)
+        self._f = f
+        self._left = stop - start
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self._left:
+            size = self._left
+        data = self._f.read(size)
+        self._left -= len(data)
+        return data
+
+    def __iter__(self):
+        return iter(self.read().splitlines(keepends=True))
+
+def append_level(path, records):
+    """Appends bars to a level file, merging the first into the file's last bar when they share a start."""
+    if not len(records):
+        return
+    records = records.copy()
+    mode = 'r+b' if os.path.exists(path) else 'w+b'
+    with open(path, mode) as f:
+        count = os.path.getsize(path) // records.dtype.itemsize
+        if count:
+            f.seek((count - 1) * records.dtype.itemsize)
+            last = np.frombuffer(f.read(records.dtype.itemsize), dtype=records.dtype)[0]
+            if records['time'][0] < last['time']:
+                raise ValueError("rows must be sorted by time")
+            if records['time'][0] == last['time']:
+                first = records[0]
+                first['open'] = last['open']
+                first['high'] = max(first['high'], last['high'])
+                first['low'] = min(first['low'], last['low'])
+                for column in records.dtype.names[5:]:
+                    first[column] += last[column]
+                count -= 1
+        f.seek(count * records.dtype.itemsize)
+        f.write(records.tobytes())
+        f.truncate()
+
+def bars_to_records(bars, columns):
+    records = np.empty(len(bars), dtype=level_dtype(columns))
+    index = bars.index if bars.index.tz is None else bars.index.tz_localize(None)
+    records['time'] = index.to_numpy(dtype='datetime64[ns]').view(np.int64)
+    for column in columns:
+        records[column] = bars[column].to_numpy(dtype=np.float64)
+    return records
+
+def build_pyramid(csv_path):
+    """Brings the sidecar levels of a CSV up to date and returns its manifest.
+
+    Only the complete lines appended since the last build are parsed, a chunk at a time: each chunk is
+    resampled to the finest level, every level is resampled from the one below, and the bars are merged
+    into the level files. A file that was replaced (e.g. an upsert rewrite), shrank or whose first bytes
+    changed is rebuilt from scratch.
+    """
+    directory, manifest_path = pyramid_paths(csv_path)
+    stat = os.stat(csv_path)
+    manifest = read_manifest(csv_path)
+    if manifest is not None and manifest['size'] == stat.st_size and manifest['mtime_ns'] == stat.st_mtime_ns:
+        return manifest
+
+    header = pd.read_csv(csv_path, nrows=0).columns.tolist()
+    head_length = min(stat.st_size, PYRAMID_HEAD_BYTES)
+    if manifest is None or 'error' in manifest or manifest.get('inode') != stat.st_ino \
+            or stat.st_size < manifest['offset'] or header != manifest['header'] \
+            or head_digest(csv_path, manifest['head_length']) != manifest['head_digest']:
+        with pyramid_lock(csv_path):
+            shutil.rmtree(directory, ignore_errors=True)
+        with open(csv_path, 'rb') as f:
+            offset = len(f.readline())
+        manifest = {'header': header, 'offset': offset, 'utc_offset': None}
+    os.makedirs(directory, exist_ok=True)
+    manifest.update(inode=stat.st_ino, size=stat.st_size, mtime_ns=stat.st_mtime_ns, head_length=head_length,
+                    head_digest=head_digest(csv_path, head_length))
+
+    required_columns = ['time', 'open', 'high', 'low', 'close', 'volume']
+    columns = required_columns + [column for column in SUM_COLUMNS[1:] if column in header]
+    bar_columns = columns[1:]
+    end = complete_length(csv_path, stat.st_size)
+    try:
+        if not all(column in header for column in required_columns):
+            raise ValueError("missing OHLCV columns")
+        if end > manifest['offset']:
+            with open(csv_path, 'rb') as f, pyramid_lock(csv_path):
+                for chunk in pd.read_csv(ByteRange(f, manifest['offset'], end), names=header, header=None,
+                                         usecols=columns, chunksize=CSV_CHUNK_ROWS):
+                    frames = chunk
+                    for level in PYRAMID_LEVELS:
+                        bars = resample_ohlcv([frames], level)
+                        if bars.index.tz is not None:
+                            utc_offset = bars.index.tz.utcoffset(None)
+                            if utc_offset is None:
+                                raise ValueError("only fixed UTC offsets are supported")
+                            manifest['utc_offset'] = utc_offset.total_seconds()
+                        append_level(os.path.join(directory, f'{level}.bin'), bars_to_records(bars, bar_columns))
+                        frames = bars.reset_index()
+        manifest['offset'] = end
+        manifest['columns'] = bar_columns
+    except ValueError as e:
+        manifest['error'] = str(e)  # served from the CSV until the file changes
+    with open(manifest_path + '.tmp', 'w') as f:
+        json.dump(manifest, f)
+    os.replace(manifest_path + '.tmp', manifest_path)
+    return manifest
+
+def pyramid_frames(csv_path, timeframe):
+    """Bars of the coarsest up-to-date level that evenly divides timeframe, as resample_ohlcv frames, or None."""
+    manifest = read_manifest(csv_path)
+    stat = os.stat(csv_path)
+    if manifest is None or 'error' in manifest or manifest['size'] != stat.st_size \
+            or manifest['mtime_ns'] != stat.st_mtime_ns:
+        return None
+    try:
+        step = pd.tseries.frequencies.to_offset(timeframe).nanos
+    except ValueError:
+        return None
+    level = next((level for level in reversed(PYRAMID_LEVELS)
+                  if step % pd.tseries.frequencies.to_offset(level).nanos == 0), None)
+    if level is None:
+        return None
+    directory, _ = pyramid_paths(csv_path)
+    path = os.path.join(directory, f'{level}.bin')
+    with pyramid_lock(csv_path):
+        if not os.path.exists(path):
+            return None
+        records = np.fromfile(path, dtype=level_dtype(manifest['columns']))
+    times = pd.to_datetime(records['time'])
+    if manifest['utc_offset'] is not None:
+        times = times.tz_localize(timezone(timedelta(seconds=manifest['utc_offset'])))
+    frame = pd.DataFrame({column: records[column] for column in manifest['columns']})
+    frame.insert(0, 'time', times)
+    return [frame.iloc[start:start + CSV_CHUNK_ROWS] for start in range(0, len(frame), CSV_CHUNK_ROWS)]
+
+def build_pyramids_forever():
+    """Background builder: keeps the levels of every CSV in ROOT up to date."""
+    while True:
+        for name in sorted(os.listdir(ROOT)):
+            if name.endswith('.csv'):
+                try:
+                    build_pyramid(os.path.join(ROOT, name))
+                except Exception as e:
+                    print(f"Error building pyramid for {name}: {e}")
+        time.sleep(PYRAMID_INTERVAL)
+
+# Threads rather than processes: loads share result_cache and the pyramid locks, their records need
+# no pickling back, and CSV tokenizing and the numpy reductions release the GIL
+chart_pool = ThreadPoolExecutor(max_workers=CHART_WORKERS, thread_name_prefix='chart')
+
+def load_panels(selected_csvs, timeframe, timeout=CHART_TIMEOUT):
+    """Loads the records of every panel concurrently; returns ({panel: records}, {panel: error message}).
+
+    Panels showing the same file share one load, so a page takes as long as its slowest file. A failing
+    file only fails its own panels. Loads still queued at the timeout are cancelled; running ones
+    cannot be interrupted, so they finish in the background and are cached for the next request.
+    """
+    chart_data = {panel: None for panel in selected_csvs}
+    chart_errors = {}
+    futures = {}
+    panels = {}  # cache key -> panels showing that file
+    for panel, selected_csv in selected_csvs.items():
+        if selected_csv == 'None':
+            continue
+        csv_path = os.path.join(ROOT, selected_csv)
+        try:
+            key = ResultCache.key(csv_path, timeframe)
+        except OSError as e:
+            chart_errors[panel] = str(e)
+            continue
+        if key not in futures:
+            futures[key] = chart_pool.submit(result_cache.get, key,
+                                             partial(load_chart_records, csv_path, timeframe))
+        panels.setdefault(key, []).append(panel)
+
+    _, pending = wait(futures.values(), timeout=timeout)
+    for future in pending:
+        future.cancel()
+
+    for key, future in futures.items():
+        if future in pending:
+            error = f"timed out after {timeout}s"
+        elif future.exception() is not None:
+            error = f"{type(future.exception()).__name__}: {future.exception()}"
+        elif future.result() is None:
+            error = "missing OHLCV columns"
+        else:
+            error = None
+        for panel in panels[key]:
+            if error is None:
+                chart_data[panel] = future.result()
+            else:
+                print(f"Error loading {selected_csvs[panel]} for {panel}: {error}")
+                chart_errors[panel] = error
+    return chart_data, chart_errors
 
 @app.route('/', methods=['GET', 'POST'])
 def index():
@@ -76,28 +506,23 @@ def index():
 
     timeframe = request.form.get('timeframe', '5S')
 
-    chart_data = {
-        'main_chart': None,
-        'chart_2': None,
-        'chart_3': None
-    }
-
-    for chart, selected_csv in selected_csvs.items():
-        if selected_csv != 'None':
-            csv_path = os.path.join(ROOT, selected_csv)
-            df = pd.read_csv(csv_path)
-
-            required_columns = ['time', 'open', 'high', 'low', 'close', 'volume']
-            if all(col in df.columns for col in required_columns):
-                # Apply resampling and calculate indicators
-                resampled_df = resample_and_indicators(df, timeframe)
-                chart_data[chart] = resampled_df.to_dict('records')
+    chart_data, chart_errors = load_panels(selected_csvs, timeframe)
 
     return render_template("index.html", 
                            csv_files=csv_files,
                            selected_csvs=selected_csvs,
                            timeframe=timeframe,
-                           chart_data=chart_data)
+                           chart_data=chart_data,
+                           chart_errors=chart_errors)
+
+@app.route('/cache_stats')
+def cache_stats():
+    return jsonify(result_cache.stats())
 
 if __name__ == '__main__':
+    # With the debug reloader only the serving child process builds
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        builder = threading.Thread(target=build_pyramids_forever)
+        builder.daemon = True
+        builder.start()
     app.run(debug=True)
@@ -0,0 +1,55 @@
+import numpy as np
+
+from candleFiles import CandleWriter, read_segments
+from candleStore import CandleStore
+
+MINUTE = 60_000
+
+def fill(store, start, count):
+    for i in range(count):
+        time = start + i * MINUTE
+        store.append(time, 100.0 + i, 101.0 + i, 99.0 + i, 100.5 + i, 1.0, 100.0 + i, 1, 1.0, 0.0)
+
+def test_collect_times_skips_unknown_times(tmp_path):
+    store = CandleStore()
+    fill(store, 0, 5)
+    writer = CandleWriter(str(tmp_path), 'BTCUSDT', '1m')
+    records = writer.collect_times(store, {3 * MINUTE, 30 * MINUTE, MINUTE, 90 * MINUTE + 1})
+    assert records['time'].tolist() == [MINUTE, 3 * MINUTE]
+    assert records['open'].tolist() == [101.0, 103.0]
+
+def test_collect_times_none_found(tmp_path):
+    store = CandleStore()
+    fill(store, 0, 3)
+    writer = CandleWriter(str(tmp_path), 'BTCUSDT', '1m')
+    assert len(writer.collect_times(store, {10 * MINUTE, 20 * MINUTE})) == 0
+    assert len(writer.collect_times(CandleStore(), {MINUTE})) == 0
+
+def test_revised_bar_evicted_by_max_age_is_not_saved(tmp_path):
+    store = CandleStore(max_age=5 * MINUTE)
+    fill(store, 0, 4)
+    writer = CandleWriter(str(tmp_path), 'BTCUSDT', '1m', fsync_interval=0)
+    writer.write_records(writer.collect(store))
+    revised = {MINUTE, 2 * MINUTE}
+    store.revise(MINUTE, 150.0, 1.0, 1)
+    store.revise(2 * MINUTE, 150.0, 1.0, 1)
+    fill(store, 4 * MINUTE, 4)  # the bar at 7m evicts the revised 1m bar before the save runs
+    records = writer.collect_times(store, revised)
+    assert records['time'].tolist() == [2 * MINUTE]
+    writer.revise(records)
+    writer.write_records(writer.collect(store))
+    writer.close()
+    saved = np.concatenate(read_segments(str(tmp_path)))
+    assert saved['time'].tolist() == [i * MINUTE for i in range(8)]
+    assert saved['high'][1] == 102.0  # the evicted revision never reached disk
+    assert saved['high'][2] == 150.0
+
+def test_revised_bar_evicted_from_full_ring(tmp_path):
+    store = CandleStore(max_bars=3)
+    fill(store, 0, 3)
+    store.revise(0, 150.0, 1.0, -1)
+    assert store.insert(MINUTE // 2 * 3, 1.0, 1.0, 1.0, 1.0)  # pushes the revised oldest bar out
+    writer = CandleWriter(str(tmp_path), 'BTCUSDT', '1m')
+    records = writer.collect_times(store, {0})
+    assert len(records) == 0
+    assert np.array_equal(store.column('time'), [MINUTE, MINUTE // 2 * 3, 2 * MINUTE])
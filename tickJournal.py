@@ -0,0 +1,129 @@
+import os
+import struct
+import time
+
+import numpy as np
+import pandas as pd
+
+DAY_MS = 86_400_000
+
+SCHEMA_VERSION = 1
+MAGIC = b'TICK'
+# magic, schema version, record size, symbol, padding up to 64 bytes
+HEADER = struct.Struct('<4sHH24s32x')
+# Bybit publicTrade fields: T (epoch ms), p (price), v (size), S (side: 1 buy, -1 sell)
+TICK = np.dtype([('time', '<i8'), ('price', '<f8'), ('size', '<f8'), ('side', 'i1')])
+SIDES = {'Buy': 1, 'Sell': -1}
+
+def segment_name(day: int):
+    return pd.Timestamp(day * DAY_MS, unit='ms').strftime('%Y-%m-%d') + '.ticks'
+
+def trades_to_records(trades):
+    """Converts a list of Bybit publicTrade dicts into TICK records."""
+    return np.array([(trade['T'], float(trade['p']), float(trade['v']), SIDES.get(trade['S'], 0))
+                     for trade in trades], dtype=TICK)
+
+def open_ticks(path: str):
+    """Memory-maps the whole records of a journal segment; a record torn by a crash is ignored."""
+    with open(path, 'rb') as f:
+        magic, version, record_size, _ = HEADER.unpack(f.read(HEADER.size))
+    if magic != MAGIC or version != SCHEMA_VERSION or record_size != TICK.itemsize:
+        raise ValueError(f"{path} is not a version {SCHEMA_VERSION} tick journal segment")
+    count = (os.path.getsize(path) - HEADER.size) // TICK.itemsize
+    if count <= 0:
+        return np.empty(0, dtype=TICK)
+    return np.memmap(path, dtype=TICK, mode='r', offset=HEADER.size, shape=(count,))
+
+class TickJournal:
+    """Write-ahead log of raw trades, one binary segment per UTC day.
+
+    Trades are appended before they are aggregated so the bars lost on a restart (everything after
+    the last candle save, including the open bars) can be rebuilt by replaying the tail.
+    fsync_interval: 0 fsyncs every append, None leaves flushing to the OS, otherwise seconds between
+    fsyncs. Segments older than keep_days are deleted when a new day starts.
+    """
+    def __init__(self, directory: str, symbol: str, fsync_interval: float = 1.0, keep_days: int = 2):
+        self.directory = directory
+        self.symbol = symbol
+        self.fsync_interval = fsync_interval
+        self.keep_days = keep_days
+        self._file = None
+        self._day = None
+        self._last_fsync = time.monotonic()
+
+    def _open_segment(self, day: int):
+        self.close()
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, segment_name(day))
+        if os.path.exists(path) and os.path.getsize(path) >= HEADER.size:
+            size = os.path.getsize(path)
+            whole = HEADER.size + (size - HEADER.size) // TICK.itemsize * TICK.itemsize
+            if whole != size:
+                os.truncate(path, whole)
+            self._file = open(path, 'ab')
+        else:
+            self._file = open(path, 'wb')
+            self._file.write(HEADER.pack(MAGIC, SCHEMA_VERSION, TICK.itemsize, self.symbol.encode()))
+        self._day = day
+        self._prune(day)
+
+    def _prune(self, day: int):
+        oldest = segment_name(day - self.keep_days + 1)
+        for name in os.listdir(self.directory):
+            if name.endswith('.ticks') and name < oldest:
+                os.remove(os.path.join(self.directory, name))
+
+    def append(self, records):
+        """Appends TICK records (see trades_to_records) and applies the fsync policy."""
+        if not len(records):
+            return
+        days = records['time'] // DAY_MS
+        bounds = [0, *(np.flatnonzero(np.diff(days)) + 1), len(records)]
+        try:
+            for begin, end in zip(bounds[:-1], bounds[1:]):
+                if days[begin] != self._day:
+                    self._open_segment(int(days[begin]))
+                self._file.write(records[begin:end].tobytes())
+            self._file.flush()
+        except OSError:
+            # Drop the handle so the next append reopens the segment and cuts the record this one tore
+            file, self._file, self._day = self._file, None, None
+            if file is not None:
+                try:
+                    file.close()
+                except OSError:
+                    pass
+            raise
+        if self.fsync_interval is not None and time.monotonic() - self._last_fsync >= self.fsync_interval:
+            self.sync()
+
+    def sync(self):
+        # Read once: sync_journal calls this from a worker thread while a rotation may close the file
+        file = self._file
+        if file is not None:
+            os.fsync(file.fileno())
+        self._last_fsync = time.monotonic()
+
+    def close(self):
+        if self._file is not None:
+            self._file.flush()
+            self.sync()
+            self._file.close()
+            self._file = None
+            self._day = None
+
+def read_journal(directory: str, since: int = None):
+    """Memory-mapped ticks of each journal segment, oldest first, starting at since (epoch ms)."""
+    if not os.path.isdir(directory):
+        return []
+    names = sorted(name for name in os.listdir(directory) if name.endswith('.ticks'))
+    if since is not None:
+        first = segment_name(since // DAY_MS)
+        names = [name for name in names if name >= first]
+    segments = []
+    for name in names:
+        ticks = open_ticks(os.path.join(directory, name))
+        if since is not None:
+            ticks = ticks[ticks['time'] >= since]
+        segments.append(ticks)
+    return segments
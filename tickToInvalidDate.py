@@ -42,6 +42,15 @@ class ChartData:
 
         return self._current_bar
 
+    def update_from_ticks(self, ticks):
+        """Applies a batch of (tick_time, price) pairs and returns every bar it touched, oldest first."""
+        touched = []
+        for tick_time, price in ticks:
+            bar = self.update_from_tick(tick_time, price)
+            if not touched or touched[-1] is not bar:
+                touched.append(bar)
+        return touched
+
 timeframes = {
     '1s': timedelta(seconds=1),
     '5s': timedelta(seconds=5),
@@ -62,13 +71,13 @@ ws_url = "wss://stream.bybit.com/v5/public/linear"
 def on_message(ws, message):
     tick = json.loads(message)
     if tick.get('topic') == 'publicTrade.BTCUSDT':
-        trade_data = tick['data'][0]
-        tick_time = datetime.fromtimestamp(trade_data['T'] / 1000)
-        price = float(trade_data['p'])
-        
+        # Bybit packs every trade since the last push into one frame; apply them all in exchange order
+        trades = sorted(tick['data'], key=lambda trade: trade['T'])
+        ticks = [(datetime.fromtimestamp(trade['T'] / 1000), float(trade['p'])) for trade in trades]
+
         for tf, data in chart_data.items():
-            updated_bar = data.update_from_tick(tick_time, price)
-            socketio.emit(f'update_chart_{tf}', updated_bar)
+            updated_bars = data.update_from_ticks(ticks)
+            socketio.emit(f'update_chart_{tf}', updated_bars)
 
 def on_error(ws, error):
     print(f"WebSocket Error: {error}")
@@ -146,9 +155,9 @@ def index():
             loadChartData(currentTimeframe);
 
             Object.keys({{ timeframes|tojson }}).forEach(tf => {
-                socket.on(`update_chart_${tf}`, function(newBar) {
+                socket.on(`update_chart_${tf}`, function(newBars) {
                     if (tf === currentTimeframe) {
-                        candleSeries.update(newBar);
+                        newBars.forEach(bar => candleSeries.update(bar));
                     }
                 });
             });
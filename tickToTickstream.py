@@ -136,11 +136,14 @@ ws_url = "wss://stream.bybit.com/v5/public/linear"
 def on_message(ws, message):
     tick = json.loads(message)
     if tick.get('topic') == 'publicTrade.BTCUSDT':
-        trade_data = tick['data'][0]
-        tick_time = pd.to_datetime(trade_data['T'] / 1000, unit='s')
-        tick_data = {'time': tick_time, 'price': float(trade_data['p'])}
-        for updated_bar in chart_data.update_from_tick(pd.Series(tick_data)):
-            socketio.emit('update_chart', updated_bar)
+        # Apply every trade in the frame in exchange order, then send each touched bar once
+        updated_bars = {}
+        for trade_data in sorted(tick['data'], key=lambda trade: trade['T']):
+            tick_time = pd.to_datetime(trade_data['T'] / 1000, unit='s')
+            tick_data = {'time': tick_time, 'price': float(trade_data['p'])}
+            for updated_bar in chart_data.update_from_tick(pd.Series(tick_data)):
+                updated_bars[updated_bar['time']] = updated_bar
+        socketio.emit('update_chart', list(updated_bars.values()))
 
 def on_error(ws, error):
     print(f"WebSocket Error: {error}")
@@ -188,8 +191,8 @@ def index():
             const candleSeries = chart.addCandlestickSeries();
             
             const socket = io();
-            socket.on('update_chart', function(newBar) {
-                candleSeries.update(newBar);
+            socket.on('update_chart', function(newBars) {
+                newBars.forEach(bar => candleSeries.update(bar));
             });
         </script>
     </body>
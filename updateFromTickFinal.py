@@ -1,77 +1,874 @@
+import argparse
+import asyncio
 import websocket
 import json
-import pandas as pd
-from flask import Flask, render_template_string
-from flask_socketio import SocketIO
-from datetime import datetime, timedelta
+import hashlib
+from collections import OrderedDict
+import numpy as np
+from flask import Flask, Response, jsonify, render_template_string, request
+from flask_socketio import SocketIO, join_room, leave_room
+from datetime import timedelta
+from decimal import Decimal
 import threading
+import multiprocessing
+from multiprocessing.connection import Client, Listener
 import os
+import resource
+import tempfile
+import time
+import urllib.parse
+import urllib.request
+import zlib
+from candleStore import COLUMNS, TOTALS, CandleStore, columns_to_bars
+from candleFiles import CandleWriter, newest_time, open_records, read_range, read_segments, segment_paths
+from indicators import IndicatorSet
+from tickJournal import TICK, TickJournal, read_journal, trades_to_records
 
 app = Flask(__name__)
 socketio = SocketIO(app)
 
 class ChartData:
-    def __init__(self, interval: timedelta):
+    def __init__(self, interval: timedelta, retention=None):
+        """
+        retention: how many closed bars to keep in memory, either a bar count (int) or a maximum age
+        (timedelta); None keeps everything.
+        """
         self._current_bar = None
         self._bar_start_time = None
+        self._folded_time = None  # start (epoch ms) and totals of the finer bar update_from_bars folded last
+        self._folded = None
         self.interval = interval
-        self.data = []
+        self._interval_ms = interval // timedelta(milliseconds=1)
+        if isinstance(retention, timedelta):
+            max_age = retention // timedelta(milliseconds=1)
+            self.data = CandleStore(max_bars=max_age // self._interval_ms + 1, max_age=max_age)
+        else:
+            self.data = CandleStore(max_bars=retention)
 
-    def _round_to_nearest_interval(self, time: datetime):
-        seconds = int(time.timestamp())
-        rounded_seconds = (seconds // int(self.interval.total_seconds())) * int(self.interval.total_seconds())
-        return datetime.fromtimestamp(rounded_seconds)
+    def _round_to_nearest_interval(self, time_ms: int):
+        return time_ms - time_ms % self._interval_ms
 
-    def update_from_tick(self, tick_time: datetime, price: float):
-        rounded_time = self._round_to_nearest_interval(tick_time)
+    def _update_bar(self, time_ms: int, open_price: float, high: float, low: float, close: float):
+        """Updates the prices of the bar time_ms falls in; callers add the totals (volume etc.)."""
+        rounded_time = self._round_to_nearest_interval(time_ms)
 
-        if self._bar_start_time is None or rounded_time >= self._bar_start_time + self.interval:
+        if self._bar_start_time is None or rounded_time >= self._bar_start_time + self._interval_ms:
             if self._current_bar is not None:
-                self.data.append(self._current_bar)
+                bar = self._current_bar
+                self.data.append(self._bar_start_time, bar['open'], bar['high'], bar['low'], bar['close'],
+                                 bar['volume'], bar['notional'], bar['trades'], bar['buy_volume'], bar['sell_volume'])
             self._bar_start_time = rounded_time
             self._current_bar = {
-                'time': self._bar_start_time.timestamp(),
-                'open': price,
-                'high': price,
-                'low': price,
-                'close': price
+                'time': self._bar_start_time / 1000,
+                'open': open_price,
+                'high': high,
+                'low': low,
+                'close': close,
+                'volume': 0.0,
+                'notional': 0.0,
+                'trades': 0,
+                'buy_volume': 0.0,
+                'sell_volume': 0.0,
             }
         else:
-            self._current_bar['high'] = max(self._current_bar['high'], price)
-            self._current_bar['low'] = min(self._current_bar['low'], price)
-            self._current_bar['close'] = price
+            self._current_bar['high'] = max(self._current_bar['high'], high)
+            self._current_bar['low'] = min(self._current_bar['low'], low)
+            self._current_bar['close'] = close
 
         return self._current_bar
 
+    def update_from_tick(self, tick_time: int, price: float, size: float = 0.0, side: int = 0):
+        """tick_time is the trade time in epoch milliseconds (Bybit's `T`); side is 1 for buys, -1 for sells."""
+        return self.update_from_ticks([(tick_time, price, size, side)])[-1]
+
+    def update_from_ticks(self, ticks):
+        """Applies a batch of (tick_time, price, size, side) tuples and returns every bar it touched, oldest first.
+
+        Ticks inside the open bar only update local ints and floats, written back to the bar dict (time
+        in epoch seconds) when the bar changes or the batch ends.
+        """
+        touched = []
+        bar = self._current_bar
+        end = None if self._bar_start_time is None else self._bar_start_time + self._interval_ms
+        if bar is not None:
+            high, low, close = bar['high'], bar['low'], bar['close']
+            volume, notional, trades = bar['volume'], bar['notional'], bar['trades']
+            buy_volume, sell_volume = bar['buy_volume'], bar['sell_volume']
+        for tick_time, price, size, side in ticks:
+            if end is None or tick_time >= end:
+                if bar is not None:
+                    bar.update(high=high, low=low, close=close, volume=volume, notional=notional, trades=trades,
+                               buy_volume=buy_volume, sell_volume=sell_volume)
+                bar = self._update_bar(tick_time, price, price, price, price)
+                end = self._bar_start_time + self._interval_ms
+                touched.append(bar)
+                high = low = close = price
+                volume = notional = buy_volume = sell_volume = 0.0
+                trades = 0
+            else:
+                if price > high:
+                    high = price
+                elif price < low:
+                    low = price
+                close = price
+                if not touched:
+                    touched.append(bar)
+            volume += size
+            notional += price * size
+            trades += 1
+            if side > 0:
+                buy_volume += size
+            elif side < 0:
+                sell_volume += size
+        if touched:
+            bar.update(high=high, low=low, close=close, volume=volume, notional=notional, trades=trades,
+                       buy_volume=buy_volume, sell_volume=sell_volume)
+        return touched
+
+    def revise(self, tick_time: int, price: float, size: float = 0.0, side: int = 0):
+        """Applies a trade older than the last one applied to the bar it belongs to.
+
+        Open and close keep the trades that arrived in order; high/low and the totals take the trade
+        in. A bucket without a bar (no trade arrived in order there) gets a new bar from the trade.
+        Returns the open bar, the revised or inserted closed bar, or None when the bucket is older than
+        the retention.
+        """
+        rounded_time = self._round_to_nearest_interval(tick_time)
+        if self._bar_start_time is not None and rounded_time >= self._bar_start_time:
+            bar = self._current_bar
+            bar['high'] = max(bar['high'], price)
+            bar['low'] = min(bar['low'], price)
+            bar['volume'] += size
+            bar['notional'] += price * size
+            bar['trades'] += 1
+            if side > 0:
+                bar['buy_volume'] += size
+            elif side < 0:
+                bar['sell_volume'] += size
+            return bar
+        bar = self.data.revise(rounded_time, price, size, side)
+        if bar is None and self.data.insert(rounded_time, price, price, price, price, size, price * size, 1,
+                                            size if side > 0 else 0.0, size if side < 0 else 0.0):
+            bar = self.data.bar(rounded_time)
+        return bar
+
+    def restore(self, replayed):
+        """Takes over the bars a journal replay rebuilt after the last stored bar, including the open one."""
+        last_time = self.data.time_at(-1) if len(self.data) else None
+        start, stop = replayed.data.index_range(None if last_time is None else last_time + 1, None)
+        if start < stop:
+            self.data.extend(replayed.data.slice(start, stop))
+        if replayed._current_bar is not None and (last_time is None or replayed._bar_start_time > last_time):
+            self._bar_start_time = replayed._bar_start_time
+            self._current_bar = replayed._current_bar
+            self._folded_time, self._folded = replayed._folded_time, replayed._folded
+
+    def update_from_columns(self, columns):
+        """Folds bars of this or a finer interval, given as time-sorted columns, into the open bar and the store.
+
+        Returns them reduced to this interval. As in update_from_bars, bars starting before the open bar
+        are merged into it; open is only taken when a bar starts.
+        """
+        columns = reduce_bars(columns, self._interval_ms, self._bar_start_time)
+        count = len(columns['time'])
+        first = 0
+        if count and self._bar_start_time is not None:
+            bar = self._current_bar
+            if columns['time'][0] == self._bar_start_time:
+                bar['high'] = max(bar['high'], columns['high'][0].item())
+                bar['low'] = min(bar['low'], columns['low'][0].item())
+                bar['close'] = columns['close'][0].item()
+                for name in TOTALS:
+                    bar[name] += columns[name][0].item()
+                first = 1
+            if first < count:
+                self.data.append(self._bar_start_time, *(bar[name] for name in COLUMNS[1:]))
+        if first < count:
+            self.data.extend({name: column[first:count - 1] for name, column in columns.items()})
+            self._bar_start_time = int(columns['time'][-1])
+            self._current_bar = {name: columns[name][-1].item() for name in COLUMNS}
+            self._current_bar['time'] = self._bar_start_time / 1000
+        return columns
+
+    def update_from_bars(self, bars):
+        """Folds bars of a finer timeframe into this one and returns every bar it touched, oldest first.
+
+        Re-folding a finer bar that is still open is harmless: open is only taken when a bar starts,
+        high/low only widen, close is overwritten and the totals only grow by what the finer bar gained
+        since it was last folded.
+        """
+        touched = []
+        for source in bars:
+            time_ms = round(source['time'] * 1000)
+            bar = self._update_bar(time_ms, source['open'], source['high'], source['low'], source['close'])
+            folded = self._folded if time_ms == self._folded_time else None
+            for name in TOTALS:
+                bar[name] += source[name] if folded is None else source[name] - folded[name]
+            self._folded_time, self._folded = time_ms, {name: source[name] for name in TOTALS}
+            if not touched or touched[-1] is not bar:
+                touched.append(bar)
+        return touched
+
+class MultiTimeframeAggregator:
+    """Aggregates ticks into the finest timeframe once and rolls the touched bars up into the coarser ones.
+
+    Each timeframe is built from the largest finer timeframe that evenly divides it, so the per-tick
+    cost is a single bar update no matter how many timeframes there are; the roll-up costs one update
+    per touched bar per timeframe per batch. A timeframe that no finer one divides (250ms next to 100ms)
+    is a root of its own and is fed the ticks too.
+    """
+    def __init__(self, timeframes, retention=None):
+        retention = retention or {}
+        ordered = sorted(timeframes.items(), key=lambda item: item[1])
+        self.chart_data = {tf: ChartData(interval, retention.get(tf)) for tf, interval in ordered}
+        self.base = ordered[0][0]
+        self.roots = [self.base]
+        self._sources = {}
+        for i, (tf, interval) in enumerate(ordered[1:], start=1):
+            source = next((finer for finer, finer_interval in reversed(ordered[:i])
+                           if interval % finer_interval == timedelta(0)), None)
+            if source is None:
+                self.roots.append(tf)
+            else:
+                self._sources[tf] = source
+
+    def _roll_up(self, touched):
+        for tf, source in self._sources.items():
+            touched[tf] = self.chart_data[tf].update_from_bars(touched[source])
+        return touched
+
+    def update_from_ticks(self, ticks):
+        """Applies a sequence of (tick_time, price, size, side) tuples and returns {tf: touched bars} for every timeframe."""
+        return self._roll_up({tf: self.chart_data[tf].update_from_ticks(ticks) for tf in self.roots})
+
+    def revise(self, tick_time, price, size=0.0, side=0):
+        """Applies a late trade to every timeframe; returns {tf: bar} as ChartData.revise does."""
+        revised = {tf: self.chart_data[tf].revise(tick_time, price, size, side) for tf in self.roots}
+        for tf, source in self._sources.items():
+            bar = revised[source]
+            if bar is not None and bar is self.chart_data[source]._current_bar:
+                # The finer open bar took the trade; folding it again adds exactly that trade
+                revised[tf] = self.chart_data[tf].update_from_bars([bar])[-1]
+            else:
+                revised[tf] = self.chart_data[tf].revise(tick_time, price, size, side)
+        return revised
+
+    def update_from_tick_records(self, ticks):
+        """Like update_from_ticks for TICK records (e.g. a journal replay), with numpy segment reductions.
+
+        Each root reduces the trades to its bars and every other timeframe reduces the bars of its
+        source, all in column form; closed bars go to the stores in bulk and only each timeframe's open
+        bar becomes a dict.
+        """
+        if not len(ticks):
+            return
+        columns = tick_columns(ticks)
+        applied = {tf: self.chart_data[tf].update_from_columns(columns) for tf in self.roots}
+        for tf, source in self._sources.items():
+            data, source_data = self.chart_data[tf], self.chart_data[source]
+            applied[tf] = data.update_from_columns(applied[source])
+            # The source's open bar is folded in whole; live updates only add what it gains from here
+            data._folded_time = source_data._bar_start_time
+            data._folded = {name: source_data._current_bar[name] for name in TOTALS}
+
+def tick_columns(ticks):
+    """TICK records as time-sorted bar columns of one trade each, for reduce_bars."""
+    ticks = ticks[np.argsort(ticks['time'], kind='stable')]
+    prices = ticks['price']
+    sizes = ticks['size']
+    return {
+        'time': ticks['time'].astype(np.int64), 'open': prices, 'high': prices, 'low': prices, 'close': prices,
+        'volume': sizes, 'notional': prices * sizes, 'trades': np.ones(len(ticks), dtype=np.int64),
+        'buy_volume': np.where(ticks['side'] > 0, sizes, 0.0), 'sell_volume': np.where(ticks['side'] < 0, sizes, 0.0),
+    }
+
+def reduce_bars(columns, interval_ms: int, floor: int = None):
+    """Merges time-sorted bar columns into bars of interval_ms with numpy segment reductions.
+
+    Bars starting before floor (epoch ms) are merged into the bar starting at floor.
+    """
+    times = columns['time'] - columns['time'] % interval_ms
+    if floor is not None and len(times) and times[0] < floor:
+        times = np.maximum(times, floor)
+    if not len(times):
+        return {name: columns[name][:0] for name in COLUMNS}
+    starts = np.flatnonzero(np.r_[True, times[1:] != times[:-1]])
+    ends = np.r_[starts[1:], len(times)] - 1
+    reduced = {
+        'time': times[starts], 'open': columns['open'][starts], 'high': np.maximum.reduceat(columns['high'], starts),
+        'low': np.minimum.reduceat(columns['low'], starts), 'close': columns['close'][ends],
+    }
+    for name in TOTALS:
+        reduced[name] = np.add.reduceat(columns[name], starts)
+    return reduced
+
+class ReorderBuffer:
+    """Holds trades for window ms so the ones a stream delivers slightly out of order are applied sorted.
+
+    A trade is released once the watermark, the newest trade time seen minus window, has passed it, or
+    once it has been held for window ms of local time so a quiet symbol is not held back. The watermark
+    stays in exchange time: a feed running behind the local clock is still reordered. Trades released
+    after newer ones are late; see SymbolFeed._apply.
+    """
+    def __init__(self, window: int):
+        self.window = window
+        self._pending = np.empty(0, dtype=TICK)
+        self._arrivals = np.empty(0, dtype=np.float64)  # time.monotonic() when each pending trade was pushed
+        self._newest = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    def push(self, records, arrived: float = None):
+        if not len(records):
+            return
+        arrivals = np.full(len(records), time.monotonic() if arrived is None else arrived)
+        self._pending = np.concatenate((self._pending, records)) if len(self._pending) else records
+        self._arrivals = np.concatenate((self._arrivals, arrivals))
+        newest = int(records['time'].max())
+        self._newest = newest if self._newest is None else max(self._newest, newest)
+
+    def release(self, now: float = None):
+        """Returns, sorted by time, the pending trades up to the watermark or up to the newest one pushed
+        before now - window (now in time.monotonic() seconds)."""
+        if not len(self._pending):
+            return self._pending
+        now = time.monotonic() if now is None else now
+        # Frames are mostly in order already, which the stable sort handles in about linear time
+        order = np.argsort(self._pending['time'], kind='stable')
+        pending, arrivals = self._pending[order], self._arrivals[order]
+        count = int(np.searchsorted(pending['time'], self._newest - self.window, side='right'))
+        expired = np.flatnonzero(arrivals <= now - self.window / 1000)
+        if len(expired):
+            count = max(count, int(expired[-1]) + 1)
+        self._pending, self._arrivals = pending[count:], arrivals[count:]
+        return pending[:count]
+
+class ChunkCache:
+    """LRU of pre-encoded JSON bodies and their strong ETags, keyed by (tf, chunk index)."""
+    def __init__(self, max_chunks: int):
+        self.max_chunks = max_chunks
+        self._chunks = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, build):
+        """Returns (body, etag) for key, calling build() -> body bytes on a miss."""
+        with self._lock:
+            if key in self._chunks:
+                self._chunks.move_to_end(key)
+                return self._chunks[key]
+        body = build()
+        entry = (body, hashlib.blake2b(body, digest_size=16).hexdigest())
+        with self._lock:
+            self._chunks[key] = entry
+            self._chunks.move_to_end(key)
+            while len(self._chunks) > self.max_chunks:
+                self._chunks.popitem(last=False)
+        return entry
+
+    def invalidate(self, key):
+        with self._lock:
+            self._chunks.pop(key, None)
+
+class TailCache:
+    """JSON of the closed bars in the newest chunk of each (symbol, tf), extended as bars close.
+
+    /tail then encodes only the bars closed since the previous request and the open bar. Revised bars
+    drop the entry; a build that raced with a revision is not stored.
+    """
+    def __init__(self):
+        self._tails = {}  # key -> (chunk index, time of the newest encoded bar, encoded bars)
+        self._versions = {}  # key -> invalidation count
+        self._lock = threading.Lock()
+
+    def get(self, key, chunk, extend):
+        """Returns the encoded closed bars of chunk, calling extend(after) -> (newest time, encoded bars)
+        for the ones newer than after (epoch ms, None for the whole chunk)."""
+        with self._lock:
+            version = self._versions.get(key, 0)
+            tail = self._tails.get(key)
+        if tail is None or tail[0] != chunk:
+            tail = (chunk, None, '')
+        newest, encoded = extend(tail[1])
+        if encoded:
+            tail = (chunk, newest, f'{tail[2]}, {encoded}' if tail[2] else encoded)
+        with self._lock:
+            if self._versions.get(key, 0) == version:
+                self._tails[key] = tail
+        return tail[2]
+
+    def invalidate(self, key):
+        with self._lock:
+            self._versions[key] = self._versions.get(key, 0) + 1
+            self._tails.pop(key, None)
+
+class BroadcastScheduler:
+    """Coalesces bar updates per timeframe and emits them at a fixed cadence.
+
+    Between flushes only the latest state of each timeframe's open bar is kept, so the outbound rate
+    per timeframe is bounded by its cadence no matter how many trades arrive. A bar that stops being
+    the open one is queued as closed and delivered exactly once, ahead of the open bar, on the next
+    flush.
+    """
+    def __init__(self, emit, cadence, watched=None, emit_revised=None):
+        self._emit = emit  # emit(tf, bars)
+        self.cadence = cadence  # tf -> seconds between flushes
+        self._watched = watched  # watched(tf) -> False drops the timeframe's pending updates unsent
+        self._emit_revised = emit_revised  # emit_revised(tf, bars) for closed bars changed by late trades
+        self._lock = threading.Lock()
+        self._latest = {}
+        self._revised = {}
+        self._closed = {tf: [] for tf in cadence}
+        self._dirty = set()
+        self._next_flush = {tf: 0.0 for tf in cadence}
+
+    def publish(self, touched):
+        """Records {tf: touched bars} as returned by MultiTimeframeAggregator.update_from_ticks."""
+        with self._lock:
+            for tf, bars in touched.items():
+                for bar in bars:
+                    latest = self._latest.get(tf)
+                    if latest is not None and latest is not bar:
+                        self._closed[tf].append(latest)
+                    self._latest[tf] = bar
+                if bars:
+                    self._dirty.add(tf)
+
+    def revise(self, revised):
+        """Records {tf: closed bars revised by late trades}; they are emitted on the next flush, whatever the cadence."""
+        with self._lock:
+            for tf, bars in revised.items():
+                self._revised.setdefault(tf, {}).update((bar['time'], bar) for bar in bars)
+
+    def flush(self):
+        """Emits every timeframe that has pending updates and whose cadence has elapsed, then any revisions."""
+        now = time.monotonic()
+        batches = {}
+        with self._lock:
+            revised, self._revised = self._revised, {}
+            for tf in [tf for tf in self._dirty if now >= self._next_flush[tf]]:
+                if self._watched is None or self._watched(tf):
+                    batches[tf] = self._closed[tf] + [dict(self._latest[tf])]
+                self._closed[tf] = []
+                self._dirty.discard(tf)
+                self._next_flush[tf] = now + self.cadence[tf]
+        for tf, bars in batches.items():
+            self._emit(tf, bars)
+        if self._emit_revised is not None:
+            for tf, bars in revised.items():
+                self._emit_revised(tf, sorted(bars.values(), key=lambda bar: bar['time']))
+
+class SymbolFeed:
+    """Everything kept per symbol: the aggregator and its stores, candle writers, tick journal and broadcaster."""
+    def __init__(self, symbol, timeframes, retention, data_dir, journal_dir, fsync_interval, journal_fsync_interval,
+                 broadcast_cadence, emit, watched, reorder_window=timedelta(0), emit_revised=None,
+                 indicator_timeframes=()):
+        """
+        emit(symbol, tf, bars) sends live bars; watched(symbol, tf) says whether anybody is viewing them;
+        emit_revised(symbol, tf, bars) sends closed bars revised by trades older than reorder_window.
+        The bars of indicator_timeframes carry live indicator values (see indicators.IndicatorSet).
+        """
+        self.symbol = symbol
+        self.topic = f'publicTrade.{symbol}'
+        self.timeframes = timeframes
+        self.retention = retention
+        self.aggregator = MultiTimeframeAggregator(timeframes, retention)
+        self.chart_data = self.aggregator.chart_data
+        self.data_dir = os.path.join(data_dir, symbol)
+        self.candle_writers = {tf: CandleWriter(os.path.join(self.data_dir, tf), symbol, tf, fsync_interval)
+                               for tf in self.chart_data}
+        self.journal_dir = os.path.join(journal_dir, symbol)
+        self.journal = TickJournal(self.journal_dir, symbol, journal_fsync_interval)
+        self.broadcaster = BroadcastScheduler(
+            lambda tf, bars: emit(symbol, tf, bars), broadcast_cadence, lambda tf: watched(symbol, tf),
+            None if emit_revised is None else lambda tf, bars: emit_revised(symbol, tf, bars))
+        self.indicators = {tf: IndicatorSet() for tf in indicator_timeframes}
+        self.reorder = ReorderBuffer(reorder_window // timedelta(milliseconds=1))
+        self.revised_times = {tf: set() for tf in self.chart_data}  # closed bars to rewrite on disk
+        self.dropped_late = 0  # late trade x timeframe pairs older than the timeframe's retention
+        self.journal_errors = 0  # frames in a row the journal failed to write
+        self._last_time = None  # newest trade time applied
+        self._lock = threading.Lock()  # the stores are shared by aggregation, the save and HTTP threads and the mirror
+
+    def on_trades(self, trades):
+        """Journals the trades of one publicTrade frame and aggregates the ones the reorder window releases."""
+        # Bybit packs every trade since the last push into one frame; apply them all in exchange order
+        records = trades_to_records(sorted(trades, key=lambda trade: trade['T']))
+        with self._lock:
+            try:
+                self.journal.append(records)
+            except OSError as error:
+                # The charts keep going; only a restart before the next candle save would lose these trades
+                self.journal_errors += 1
+                if self.journal_errors == 1:
+                    print(f"Error journaling {self.symbol} trades: {error!r}")
+            else:
+                if self.journal_errors:
+                    print(f"Journaling {self.symbol} trades again after {self.journal_errors} failed frames")
+                    self.journal_errors = 0
+            self.reorder.push(records)
+            self._apply(self.reorder.release())
+
+    def release(self):
+        """Aggregates the trades held for the whole reorder window, for symbols that went quiet."""
+        if len(self.reorder):
+            with self._lock:
+                self._apply(self.reorder.release())
+
+    def _apply(self, ticks):
+        """Aggregates sorted trades; the ones older than a trade already applied revise their bars instead."""
+        if not len(ticks):
+            return
+        late = 0 if self._last_time is None else int(np.searchsorted(ticks['time'], self._last_time, side='left'))
+        if late:
+            self._revise(ticks[:late])
+        ticks = ticks[late:]
+        if len(ticks):
+            self._last_time = int(ticks['time'][-1])
+            touched = self.aggregator.update_from_ticks(list(zip(
+                ticks['time'].tolist(), ticks['price'].tolist(), ticks['size'].tolist(), ticks['side'].tolist())))
+            for tf, indicators in self.indicators.items():
+                indicators.observe(touched[tf])
+            self.broadcaster.publish(touched)
+
+    def _revise(self, ticks):
+        touched = {}
+        revised = {}
+        for tick in zip(ticks['time'].tolist(), ticks['price'].tolist(), ticks['size'].tolist(), ticks['side'].tolist()):
+            for tf, bar in self.aggregator.revise(*tick).items():
+                if bar is None:
+                    self.dropped_late += 1
+                elif bar is self.chart_data[tf]._current_bar:
+                    touched[tf] = [bar]
+                else:
+                    revised.setdefault(tf, []).append(bar)
+                    self.revised_times[tf].add(round(bar['time'] * 1000))
+        for tf, bars in touched.items():
+            if tf in self.indicators:
+                self.indicators[tf].observe(bars)
+        self.broadcaster.publish(touched)
+        self.broadcaster.revise(revised)
+
+    def save(self):
+        """Appends only the bars closed since the previous save, then rewrites the ones revised on disk.
+
+        The bars are copied under the lock, since in the threads runtime trades are applied concurrently.
+        """
+        for tf, data in self.chart_data.items():
+            writer = self.candle_writers[tf]
+            with self._lock:
+                records = writer.collect(data.data)
+            writer.write_records(records)
+            with self._lock:
+                revised = self.collect_revised(tf)
+            writer.revise(revised)
+
+    def collect_revised(self, tf):
+        """RECORD rows of the closed bars of tf revised since the last call (cheap, no I/O)."""
+        times, self.revised_times[tf] = self.revised_times[tf], set()
+        return self.candle_writers[tf].collect_times(self.chart_data[tf].data, times)
+
+    def load(self):
+        """Loads the saved bars within each timeframe's retention, then replays the journal tail."""
+        now_ms = int(time.time() * 1000)
+        for tf, data in self.chart_data.items():
+            directory = os.path.join(self.data_dir, tf)
+            since = None if data.data.max_age is None else now_ms - data.data.max_age
+            for records in read_segments(directory, since):
+                if len(records):
+                    data.data.extend_records(records)  # the store's retention decides how much history stays loaded
+            # Even when nothing on disk is recent enough to load, only bars after it may be appended
+            self.candle_writers[tf].last_time = newest_time(directory)
+        self.replay_journal()
+        for tf, indicators in self.indicators.items():
+            data = self.chart_data[tf]
+            indicators.warm_up(data.data.to_records())
+            if data._current_bar is not None:
+                indicators.observe([data._current_bar])
+
+    def replay_journal(self):
+        """Rebuilds the bars lost since the last save, including the open ones, from the tick journal."""
+        # Replay from the start of the oldest bar that is not on disk yet
+        starts = [None if self.candle_writers[tf].last_time is None
+                  else self.candle_writers[tf].last_time + data._interval_ms
+                  for tf, data in self.chart_data.items()]
+        since = None if None in starts else min(starts)
+        replayed = MultiTimeframeAggregator(self.timeframes, self.retention)
+        for ticks in read_journal(self.journal_dir, since):
+            replayed.update_from_tick_records(ticks)
+            if len(ticks):
+                self._last_time = max(self._last_time or 0, int(ticks['time'].max()))
+        for tf, data in self.chart_data.items():
+            data.restore(replayed.chart_data[tf])
+
+    def apply_bars(self, tf, bars):
+        """Mirrors bars published by the shard process that aggregates this symbol, oldest first.
+
+        Re-applying a published bar is harmless (see ChartData.update_from_bars); bars older than the
+        mirror's open bar, e.g. re-sent by a restarted shard, are skipped.
+        """
+        data = self.chart_data[tf]
+        with self._lock:
+            for bar in bars:
+                time_ms = round(bar['time'] * 1000)
+                last_time = data._bar_start_time if data._bar_start_time is not None \
+                    else data.data.time_at(-1) + 1 if len(data.data) else None
+                if last_time is None or time_ms >= last_time:
+                    data._update_bar(time_ms, bar['open'], bar['high'], bar['low'], bar['close']).update(
+                        (name, bar[name]) for name in TOTALS)
+
+    def apply_revised(self, tf, bars):
+        """Mirrors closed bars the shard process revised, or inserted, after late trades."""
+        data = self.chart_data[tf]
+        with self._lock:
+            for bar in bars:
+                time_ms = round(bar['time'] * 1000)
+                if not data.data.replace(time_ms, {name: bar[name] for name in COLUMNS[1:]}):
+                    data.data.insert(time_ms, *(bar[name] for name in COLUMNS[1:]))
+
+    def query_columns(self, tf, from_time=None, to_time=None, limit=None):
+        """The newest (up to limit) bars with from_time <= time < to_time (epoch ms) as {column: array}.
+
+        The open bar and the in-memory store are binary searched first; history older than the store's
+        retention is read from the on-disk segments. Columns are sliced, never expanded into per-bar dicts.
+        The memory part is copied under the feed lock (aggregation shifts and overwrites the ring); the
+        disk part is read after releasing it.
+        """
+        data = self.chart_data[tf]
+        last_time = None if to_time is None else to_time - 1
+        remaining = limit
+        parts = []
+        with self._lock:
+            current_bar, bar_start_time = data._current_bar, data._bar_start_time
+            if current_bar is not None and (from_time is None or bar_start_time >= from_time) \
+                    and (last_time is None or bar_start_time <= last_time):
+                parts.append({name: np.array([bar_start_time if name == 'time' else current_bar.get(name, 0.0)])
+                              for name in COLUMNS})
+                remaining = None if remaining is None else remaining - 1
+            start, stop = data.data.index_range(from_time, last_time)
+            if remaining is not None:
+                start = max(start, stop - remaining)
+                remaining -= stop - start
+            parts.append({name: column.copy() for name, column in data.data.slice(start, stop).items()})
+            first_time = data.data.time_at(0) if len(data.data) else None
+        if (remaining is None or remaining > 0) and (first_time is None or from_time is None or from_time < first_time):
+            disk_last = last_time if first_time is None else first_time - 1 if last_time is None \
+                else min(last_time, first_time - 1)
+            parts.append(read_range(os.path.join(self.data_dir, tf), from_time, disk_last, remaining))
+        parts.reverse()
+        return {name: np.concatenate([part[name] for part in parts]) for name in COLUMNS}
+
+    def first_time(self, tf):
+        """Time (epoch ms) of the oldest bar available for tf, on disk or in memory, or None."""
+        data = self.chart_data[tf]
+        for path in segment_paths(os.path.join(self.data_dir, tf)):
+            records = open_records(path)
+            if len(records):
+                return int(records['time'][0])
+        with self._lock:
+            if len(data.data):
+                return data.data.time_at(0)
+            return data._bar_start_time
+
 timeframes = {
+    '100ms': timedelta(milliseconds=100),
+    '250ms': timedelta(milliseconds=250),
+    '500ms': timedelta(milliseconds=500),
     '1s': timedelta(seconds=1),
     '5s': timedelta(seconds=5),
     '15s': timedelta(seconds=15),
     '30s': timedelta(seconds=30),
     '1m': timedelta(minutes=1),
+    '3m': timedelta(minutes=3),
     '5m': timedelta(minutes=5),
     '15m': timedelta(minutes=15),
     '30m': timedelta(minutes=30),
     '1h': timedelta(hours=1),
+    '2h': timedelta(hours=2),
     '4h': timedelta(hours=4),
+    '6h': timedelta(hours=6),
+    '8h': timedelta(hours=8),
+    '12h': timedelta(hours=12),
+}
+
+# Closed bars kept in memory per timeframe (bar count or max age); timeframes not listed keep everything
+retention = {
+    '100ms': timedelta(hours=1),
+    '250ms': timedelta(hours=2),
+    '500ms': timedelta(hours=3),
+    '1s': timedelta(hours=6),
+    '5s': timedelta(days=1),
+    '15s': timedelta(days=2),
+    '30s': timedelta(days=4),
+    '1m': timedelta(days=7),
+    '3m': timedelta(days=30),
+    '5m': timedelta(days=30),
+    '15m': timedelta(days=90),
+    '30m': timedelta(days=180),
+    '1h': timedelta(days=365),
+}
+
+page_size = 500  # bars per /get_data page unless the client asks for another limit
+max_page_size = 5000
+chunk_size = 1000  # bars per closed /get_data/<symbol>/<tf>/chunks/<n> chunk
+max_cached_chunks = 1024
+
+# TradingView UDF resolution -> timeframe
+udf_resolutions = {
+    '1S': '1s',
+    '5S': '5s',
+    '15S': '15s',
+    '30S': '30s',
+    '1': '1m',
+    '3': '3m',
+    '5': '5m',
+    '15': '15m',
+    '30': '30m',
+    '60': '1h',
+    '120': '2h',
+    '240': '4h',
+    '360': '6h',
+    '480': '8h',
+    '720': '12h',
+}
+
+# Seconds between Socket.IO updates per timeframe; charts repaint at ~60Hz at most
+broadcast_cadence = {
+    '100ms': 0.05,
+    '250ms': 0.05,
+    '500ms': 0.05,
+    '1s': 0.05,
+    '5s': 0.1,
+    '15s': 0.1,
+    '30s': 0.25,
+    '1m': 0.25,
+    '3m': 0.5,
+    '5m': 0.5,
+    '15m': 0.5,
+    '30m': 1.0,
+    '1h': 1.0,
+    '2h': 1.0,
+    '4h': 1.0,
+    '6h': 1.0,
+    '8h': 1.0,
+    '12h': 1.0,
 }
 
 default_timeframe = '1s'
 
-chart_data = {tf: ChartData(interval) for tf, interval in timeframes.items()}
+# Timeframes whose live bars carry SMA/RSI/MACD/VWAP values in an 'indicators' field (see indicators.py)
+indicator_timeframes = ['1m', '5m', '15m', '1h']
+
+# How long trades are held so ones delivered out of order (e.g. around reconnects) are aggregated sorted;
+# anything later revises its closed bars and is sent to clients as a bar_revised event
+reorder_window = timedelta(milliseconds=250)
+
+# Linear perpetuals to chart; all of them share one WebSocket connection
+symbols = ['BTCUSDT', 'ETHUSDT', 'SOLUSDT']
+default_symbol = symbols[0]
+# TradingView pricescale and minmov per symbol (price tick = minmov / pricescale), 100 and 1 when not listed;
+# filled from Bybit's tick sizes when the symbols are fetched
+udf_price_scales = {'BTCUSDT': 10}
+udf_min_moves = {}
+
+data_dir = 'data'  # closed bars are appended to data/<symbol>/<tf>/<YYYY-MM-DD>.bin (export with candleFiles.py)
+fsync_interval = 300  # seconds between fsyncs of the candle segments
+journal_dir = 'journal'  # raw trades per symbol, written before aggregation and replayed on startup
+journal_fsync_interval = 1.0  # seconds between journal fsyncs; 0 = every frame, None = leave it to the OS
+
+# Socket.IO room per (symbol, timeframe); clients join the one they are viewing
+room_members = {}  # room -> sids
+client_rooms = {}  # sid -> rooms
+
+def chart_room(symbol, tf):
+    return f'{symbol}:{tf}'
+
+def is_watched(symbol, tf):
+    return bool(room_members.get(chart_room(symbol, tf)))
+
+def emit_bars(symbol, tf, bars):
+    socketio.emit(f'update_chart_{tf}', bars, to=chart_room(symbol, tf))
+
+def revise_bars(symbol, tf, bars):
+    """Drops the cached chunks holding revised closed bars and patches them on the charts viewing them."""
+    span = chunk_span(tf)
+    for index in {round(bar['time'] * 1000) // span for bar in bars}:
+        chunk_cache.invalidate((symbol, tf, index))
+    tail_cache.invalidate((symbol, tf))
+    if is_watched(symbol, tf):
+        socketio.emit('bar_revised', {'timeframe': tf, 'bars': bars}, to=chart_room(symbol, tf))
 
 ws_url = "wss://stream.bybit.com/v5/public/linear"
+instruments_url = "https://api.bybit.com/v5/market/instruments-info"
+max_subscribe_args = 10  # Bybit rejects subscribe requests with more topics than this
+ingest_queue_size = 10000  # raw frames buffered between the socket reader and aggregation
+
+feeds = {}
+feeds_by_topic = {}
+subscribe_messages = []
+chunk_cache = ChunkCache(max_cached_chunks)
+tail_cache = TailCache()
+
+def set_symbols(names, emit=emit_bars, watched=is_watched, emit_revised=revise_bars):
+    """(Re)creates the feeds and the subscribe requests for names."""
+    global default_symbol
+    symbols[:] = names
+    feeds.clear()
+    feeds.update({
+        symbol: SymbolFeed(symbol, timeframes, retention, data_dir, journal_dir, fsync_interval, journal_fsync_interval,
+                           broadcast_cadence, emit, watched, reorder_window, emit_revised, indicator_timeframes)
+        for symbol in symbols
+    })
+    feeds_by_topic.clear()
+    feeds_by_topic.update({feed.topic: feed for feed in feeds.values()})
+    subscribe_messages[:] = [
+        json.dumps({"op": "subscribe", "args": list(feeds_by_topic)[i:i + max_subscribe_args]})
+        for i in range(0, len(feeds_by_topic), max_subscribe_args)
+    ]
+    if default_symbol not in feeds and symbols:
+        default_symbol = symbols[0]
+
+set_symbols(symbols)
+
+def raise_file_limit():
+    """Raises the soft open-file limit to the hard one; every symbol keeps a journal open and
+    'all' symbols with the sockets and chunk files easily pass the usual default of 1024."""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard == resource.RLIM_INFINITY or soft < hard:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        except (ValueError, OSError) as error:
+            print(f"Could not raise the open file limit from {soft}: {error}")
+
+def fetch_linear_instruments():
+    """{symbol: instrument info} of every linear contract Bybit currently lists as trading."""
+    instruments = {}
+    cursor = ''
+    while True:
+        query = urllib.parse.urlencode({'category': 'linear', 'limit': 1000, 'cursor': cursor})
+        with urllib.request.urlopen(f"{instruments_url}?{query}", timeout=10) as response:
+            result = json.load(response)['result']
+        instruments.update((item['symbol'], item) for item in result['list'] if item.get('status') == 'Trading')
+        cursor = result.get('nextPageCursor')
+        if not cursor:
+            return instruments
+
+def set_price_scales(instruments):
+    """Sets the TradingView pricescale/minmov of each symbol from its priceFilter.tickSize."""
+    for symbol, item in instruments.items():
+        tick = Decimal(item['priceFilter']['tickSize']).normalize()
+        scale = 10 ** max(0, -tick.as_tuple().exponent)
+        udf_price_scales[symbol] = scale
+        udf_min_moves[symbol] = int(tick * scale)
 
 def on_message(ws, message):
+    handle_message(message)
+
+def handle_message(message):
     tick = json.loads(message)
-    if tick.get('topic') == 'publicTrade.BTCUSDT':
-        trade_data = tick['data'][0]
-        tick_time = datetime.fromtimestamp(trade_data['T'] / 1000)
-        price = float(trade_data['p'])
-        
-        for tf, data in chart_data.items():
-            updated_bar = data.update_from_tick(tick_time, price)
-            socketio.emit(f'update_chart_{tf}', updated_bar)
+    feed = feeds_by_topic.get(tick.get('topic'))
+    if feed is not None:
+        feed.on_trades(tick['data'])
 
 def on_error(ws, error):
     print(f"WebSocket Error: {error}")
@@ -81,24 +878,57 @@ def on_close(ws, close_status_code, close_msg):
 
 def on_open(ws):
     print("Bybit WebSocket Opened")
-    ws.send('{"op": "subscribe","args": ["publicTrade.BTCUSDT"]}')
+    for subscribe_message in subscribe_messages:
+        ws.send(subscribe_message)
 
 def save_data_to_csv():
     while True:
-        for tf, data in chart_data.items():
-            df = pd.DataFrame(data.data)
-            if not df.empty:
-                df['time'] = pd.to_datetime(df['time'], unit='s')
-                df.to_csv(f'data_{tf}.csv', index=False)
+        for feed in feeds.values():
+            try:
+                feed.save()
+            except Exception as error:
+                print(f"Error saving {feed.symbol}: {error!r}")  # closed bars not written are retried next pass
         socketio.sleep(60)  # Save every minute
 
 def load_data_from_csv():
-    for tf, data in chart_data.items():
-        file_name = f'data_{tf}.csv'
-        if os.path.exists(file_name):
-            df = pd.read_csv(file_name)
-            df['time'] = pd.to_datetime(df['time']).astype(int) // 10**9
-            data.data = df.to_dict('records')[-250:]  # Load last 250 candles
+    for feed in feeds.values():
+        feed.load()
+
+def release_trades():
+    """Aggregates the trades quiet symbols still hold in their reorder windows."""
+    for feed in feeds.values():
+        feed.release()
+
+def flush_broadcasts():
+    for feed in feeds.values():
+        feed.broadcaster.flush()
+
+def broadcast_forever():
+    while True:
+        release_trades()
+        flush_broadcasts()
+        socketio.sleep(min(broadcast_cadence.values()))
+
+@socketio.on('subscribe')
+def on_subscribe(message):
+    if message.get('symbol', default_symbol) not in feeds or message.get('timeframe') not in timeframes:
+        return
+    room = chart_room(message.get('symbol', default_symbol), message['timeframe'])
+    join_room(room)
+    room_members.setdefault(room, set()).add(request.sid)
+    client_rooms.setdefault(request.sid, set()).add(room)
+
+@socketio.on('unsubscribe')
+def on_unsubscribe(message):
+    room = chart_room(message.get('symbol', default_symbol), message.get('timeframe'))
+    leave_room(room)
+    room_members.get(room, set()).discard(request.sid)
+    client_rooms.get(request.sid, set()).discard(room)
+
+@socketio.on('disconnect')
+def on_disconnect(*args):
+    for room in client_rooms.pop(request.sid, set()):
+        room_members.get(room, set()).discard(request.sid)
 
 @app.route('/')
 def index():
@@ -117,6 +947,11 @@ def index():
     </head>
     <body>
         <div id="timeframe-buttons">
+            <select id="symbol-select" onchange="window.location.search = '?symbol=' + this.value">
+                {% for s in symbols %}
+                    <option value="{{ s }}" {% if s == symbol %}selected{% endif %}>{{ s }}</option>
+                {% endfor %}
+            </select>
             {% for tf in timeframes %}
                 <button class="timeframe-button {% if tf == default_timeframe %}active{% endif %}" data-timeframe="{{ tf }}">{{ tf }}</button>
             {% endfor %}
@@ -147,6 +982,7 @@ def index():
             const candleSeries = {};
             const timeframes = {{ timeframes|tojson }};
             let currentTimeframe = '{{ default_timeframe }}';
+            const symbol = '{{ symbol }}';
 
             // Create a series for each timeframe
             timeframes.forEach(tf => {
@@ -160,14 +996,52 @@ def index():
 
             const socket = io();
 
+            // Only the visible timeframe's room receives live updates; rejoin after reconnects
+            socket.on('connect', () => socket.emit('subscribe', { symbol: symbol, timeframe: currentTimeframe }));
+
+            // Bars currently set on each series, oldest first, so older pages can be prepended
+            const seriesData = {};
+            const history = {};
+
+            // The tail is the still-changing newest chunk; older chunks are cached by the browser and revalidated by ETag
             function loadChartData(timeframe) {
-                fetch(`/get_data/${timeframe}`)
+                history[timeframe] = { loading: true };
+                fetch(`/get_data/${symbol}/${timeframe}/tail`)
+                    .then(response => response.json())
+                    .then(tail => {
+                        seriesData[timeframe] = tail.bars;
+                        candleSeries[timeframe].setData(tail.bars);
+                        history[timeframe] = { loading: false, nextChunk: tail.chunk - 1, firstChunk: tail.first_chunk };
+                    });
+            }
+
+            function loadOlderData(timeframe) {
+                const state = history[timeframe];
+                if (!state || state.loading || state.firstChunk === null || state.nextChunk < state.firstChunk) {
+                    return;
+                }
+                state.loading = true;
+                fetch(`/get_data/${symbol}/${timeframe}/chunks/${state.nextChunk}`)
                     .then(response => response.json())
-                    .then(data => {
-                        candleSeries[timeframe].setData(data);
+                    .then(older => {
+                        state.loading = false;
+                        state.nextChunk -= 1;
+                        if (older.length) {
+                            seriesData[timeframe] = older.concat(seriesData[timeframe]);
+                            candleSeries[timeframe].setData(seriesData[timeframe]);
+                        } else {
+                            loadOlderData(timeframe);  // a gap in the history, keep going
+                        }
                     });
             }
 
+            // Fetch the previous page when the user scrolls close to the oldest loaded bar
+            chart.timeScale().subscribeVisibleLogicalRangeChange(range => {
+                if (range && range.from < 10) {
+                    loadOlderData(currentTimeframe);
+                }
+            });
+
             function switchTimeframe(newTimeframe) {
                 document.querySelector(`[data-timeframe="${currentTimeframe}"]`).classList.remove('active');
                 document.querySelector(`[data-timeframe="${newTimeframe}"]`).classList.add('active');
@@ -178,6 +1052,8 @@ def index():
                 candleSeries[newTimeframe].applyOptions({
                     visible: true
                 });
+                socket.emit('unsubscribe', { symbol: symbol, timeframe: currentTimeframe });
+                socket.emit('subscribe', { symbol: symbol, timeframe: newTimeframe });
                 currentTimeframe = newTimeframe;
                 loadChartData(currentTimeframe);
             }
@@ -189,43 +1065,451 @@ def index():
                 });
             });
 
-            // Load initial data for all timeframes
-            timeframes.forEach(tf => loadChartData(tf));
+            // Load the visible timeframe; others are loaded when switched to
+            loadChartData(currentTimeframe);
 
-            // Listen for updates on all timeframes
+            // Closed bars changed or created by late trades; patch them in place instead of reloading
+            socket.on('bar_revised', function(revision) {
+                const data = seriesData[revision.timeframe];
+                if (!data) {
+                    return;
+                }
+                revision.bars.forEach(bar => {
+                    let lo = 0, hi = data.length;
+                    while (lo < hi) {
+                        const mid = (lo + hi) >> 1;
+                        if (data[mid].time < bar.time) lo = mid + 1; else hi = mid;
+                    }
+                    if (lo < data.length && data[lo].time === bar.time) {
+                        data[lo] = bar;
+                    } else if (lo > 0) {
+                        data.splice(lo, 0, bar);  // bars before the loaded range arrive with their chunk
+                    }
+                });
+                candleSeries[revision.timeframe].setData(data);
+            });
+
+            // Updates only arrive for subscribed timeframes
             timeframes.forEach(tf => {
-                socket.on(`update_chart_${tf}`, function(newBar) {
-                    candleSeries[tf].update(newBar);
+                socket.on(`update_chart_${tf}`, function(newBars) {
+                    const data = seriesData[tf];
+                    newBars.forEach(bar => {
+                        candleSeries[tf].update(bar);
+                        if (data) {
+                            if (data.length && data[data.length - 1].time === bar.time) {
+                                data[data.length - 1] = bar;
+                            } else if (!data.length || data[data.length - 1].time < bar.time) {
+                                data.push(bar);
+                            }
+                        }
+                    });
                 });
             });
         </script>
     </body>
     </html>
     """
-    return render_template_string(html_template, timeframes=list(timeframes.keys()), default_timeframe=default_timeframe)
+    symbol = request.args.get('symbol', default_symbol)
+    if symbol not in feeds:
+        symbol = default_symbol
+    return render_template_string(html_template, timeframes=list(timeframes.keys()), default_timeframe=default_timeframe,
+                                  symbol=symbol, symbols=symbols)
+
+def query_bars(feed, tf, from_time=None, to_time=None, limit=page_size):
+    """Like SymbolFeed.query_columns, as Lightweight Charts bar dicts oldest first."""
+    return columns_to_bars(feed.query_columns(tf, from_time, to_time, limit))
+
+def chunk_span(tf):
+    return chunk_size * (timeframes[tf] // timedelta(milliseconds=1))
+
+@app.route('/get_data/<symbol>/<timeframe>/chunks/<int:index>')
+def get_data_chunk(symbol, timeframe, index):
+    """Closed bars of chunk index (times in [index, index + 1) * chunk span).
+
+    Late trades can still revise closed bars, so caches must revalidate; an unchanged chunk costs a 304.
+    """
+    feed = feeds.get(symbol)
+    if feed is None or timeframe not in timeframes:
+        return jsonify([]), 404
+    data = feed.chart_data[timeframe]
+    span = chunk_span(timeframe)
+    if data._bar_start_time is None or (index + 1) * span > data._bar_start_time:
+        return jsonify({"error": "chunk is still open, use /tail"}), 404
+    body, etag = chunk_cache.get(
+        (symbol, timeframe, index),
+        lambda: json.dumps(query_bars(feed, timeframe, index * span, (index + 1) * span, None)).encode())
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'public, no-cache'
+    return response
+
+@app.route('/get_data/<symbol>/<timeframe>/tail')
+def get_data_tail(symbol, timeframe):
+    """Bars of the newest, still open chunk plus where the older chunks start.
+
+    The closed bars are encoded once (see TailCache); each request encodes only the open bar.
+    """
+    feed = feeds.get(symbol)
+    if feed is None or timeframe not in timeframes:
+        return jsonify({"chunk": 0, "first_chunk": None, "bars": []}), 404
+    bar_start_time = feed.chart_data[timeframe]._bar_start_time
+    span = chunk_span(timeframe)
+    oldest = feed.first_time(timeframe)
+    chunk = (bar_start_time if bar_start_time is not None else int(time.time() * 1000)) // span
+
+    def extend(after):
+        columns = feed.query_columns(timeframe, chunk * span if after is None else after + 1, bar_start_time, None)
+        if not len(columns['time']):
+            return after, ''
+        return int(columns['time'][-1]), json.dumps(columns_to_bars(columns))[1:-1]
+
+    bars = [tail_cache.get((symbol, timeframe), chunk, extend)]
+    if bar_start_time is not None:
+        # Bars that closed since bar_start_time was read come along with the open one
+        bars.append(json.dumps(columns_to_bars(feed.query_columns(timeframe, bar_start_time, None, None)))[1:-1])
+    body = '{"chunk": %d, "first_chunk": %s, "bars": [%s]}' % (
+        chunk, json.dumps(None if oldest is None else oldest // span), ', '.join(part for part in bars if part))
+    response = Response(body, mimetype='application/json')
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 @app.route('/get_data/<timeframe>')
 def get_data(timeframe):
-    if timeframe in chart_data:
-        return json.dumps(chart_data[timeframe].data)
-    return json.dumps([])
+    """get_data_symbol for the default symbol."""
+    return get_data_symbol(default_symbol, timeframe)
+
+@app.route('/get_data/<symbol>/<timeframe>')
+def get_data_symbol(symbol, timeframe):
+    """?from=&to= are epoch seconds (from inclusive, to exclusive); limit caps the page at the newest bars."""
+    feed = feeds.get(symbol)
+    if feed is None or timeframe not in timeframes:
+        return json.dumps([])
+    from_time = request.args.get('from', type=float)
+    to_time = request.args.get('to', type=float)
+    limit = min(max(request.args.get('limit', page_size, type=int), 1), max_page_size)
+    bars = query_bars(feed, timeframe,
+                      None if from_time is None else round(from_time * 1000),
+                      None if to_time is None else round(to_time * 1000),
+                      limit)
+    return json.dumps(bars)
+
+@app.route('/udf/config')
+def udf_config():
+    return jsonify({
+        "supported_resolutions": list(udf_resolutions),
+        "supports_search": False,
+        "supports_group_request": False,
+        "supports_marks": False,
+        "supports_timescale_marks": False,
+        "supports_time": True,
+    })
+
+@app.route('/udf/time')
+def udf_time():
+    return str(int(time.time()))
+
+def udf_feed():
+    """The feed named by ?symbol= (an optional EXCHANGE: prefix is ignored), or None."""
+    return feeds.get(request.args.get('symbol', default_symbol).split(':')[-1])
+
+@app.route('/udf/symbols')
+def udf_symbols():
+    feed = udf_feed()
+    if feed is None:
+        return jsonify({"s": "error", "errmsg": "unknown_symbol"}), 404
+    symbol = feed.symbol
+    return jsonify({
+        "name": symbol,
+        "ticker": symbol,
+        "description": f"{symbol} perpetual",
+        "type": "crypto",
+        "exchange": "Bybit",
+        "listed_exchange": "Bybit",
+        "session": "24x7",
+        "timezone": "Etc/UTC",
+        "minmov": udf_min_moves.get(symbol, 1),
+        "pricescale": udf_price_scales.get(symbol, 100),
+        "has_intraday": True,
+        "has_seconds": True,
+        "seconds_multipliers": [resolution[:-1] for resolution in udf_resolutions if resolution.endswith('S')],
+        "intraday_multipliers": [resolution for resolution in udf_resolutions if not resolution.endswith('S')],
+        "supported_resolutions": list(udf_resolutions),
+        "volume_precision": 3,
+        "data_status": "streaming",
+    })
+
+@app.route('/udf/history')
+def udf_history():
+    """UDF bars for [from, to) in epoch seconds; countback, when given, takes priority over from."""
+    tf = udf_resolutions.get(request.args.get('resolution'))
+    feed = udf_feed()
+    if tf is None or feed is None:
+        return jsonify({"s": "error", "errmsg": "unknown symbol or resolution"}), 400
+    from_time = request.args.get('from', type=int)
+    to_time = request.args.get('to', type=int)
+    countback = request.args.get('countback', type=int)
+    to_ms = None if to_time is None else to_time * 1000
+    if countback:
+        columns = feed.query_columns(tf, None, to_ms, countback)
+    else:
+        columns = feed.query_columns(tf, None if from_time is None else from_time * 1000, to_ms)
+    if not len(columns['time']):
+        # Point the widget at the newest bar before the requested range, if any
+        before = feed.query_columns(tf, None, None if from_time is None else from_time * 1000, 1)
+        response = {"s": "no_data"}
+        if len(before['time']):
+            response["nextTime"] = int(before['time'][0]) // 1000
+        return jsonify(response)
+    return jsonify({
+        "s": "ok",
+        "t": (columns['time'] // 1000).tolist(),
+        "o": columns['open'].tolist(),
+        "h": columns['high'].tolist(),
+        "l": columns['low'].tolist(),
+        "c": columns['close'].tolist(),
+        "v": columns['volume'].tolist(),
+    })
+
+async def ingest(queue):
+    """Reads Bybit frames into queue, reconnecting with backoff."""
+    import websockets
+
+    delay = 1
+    while True:
+        try:
+            async with websockets.connect(ws_url, ping_interval=20) as ws:
+                print("Bybit WebSocket Opened")
+                for subscribe_message in subscribe_messages:
+                    await ws.send(subscribe_message)
+                delay = 1
+                async for message in ws:
+                    await queue.put(message)
+        except (OSError, websockets.WebSocketException) as error:
+            print(f"WebSocket Error: {error}")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 30)
+
+async def aggregate(queue):
+    """Journals and aggregates frames, and releases the trades quiet symbols hold; never waits on disk or clients.
+
+    Releasing here rather than in the broadcast thread keeps every store write on the loop.
+    """
+    interval = min(broadcast_cadence.values())
+    next_release = time.monotonic() + interval
+    while True:
+        message = None
+        if not queue.empty():
+            message = queue.get_nowait()
+        else:
+            try:
+                message = await asyncio.wait_for(queue.get(), max(next_release - time.monotonic(), 0.0))
+            except asyncio.TimeoutError:
+                pass
+        try:
+            if message is not None:
+                handle_message(message)
+            if time.monotonic() >= next_release:
+                next_release = time.monotonic() + interval
+                release_trades()
+        except Exception as error:
+            print(f"Error handling message: {error!r}")
+
+async def persist():
+    """Appends closed bars every minute; the copy happens here, the disk write in a worker thread."""
+    while True:
+        await asyncio.sleep(60)
+        for feed in feeds.values():
+            try:
+                for tf, data in feed.chart_data.items():
+                    records = feed.candle_writers[tf].collect(data.data)
+                    if len(records):
+                        await asyncio.to_thread(feed.candle_writers[tf].write_records, records)
+                    revised = feed.collect_revised(tf)
+                    if len(revised):
+                        await asyncio.to_thread(feed.candle_writers[tf].revise, revised)
+            except Exception as error:
+                print(f"Error saving {feed.symbol}: {error!r}")  # closed bars not written are retried next pass
+
+def sync_journals():
+    for feed in feeds.values():
+        feed.journal.sync()
+
+async def sync_journal():
+    """fsyncs the tick journals in a worker thread so the aggregation task never blocks on them."""
+    while True:
+        await asyncio.sleep(journal_fsync_interval or 1.0)
+        try:
+            await asyncio.to_thread(sync_journals)
+        except (OSError, ValueError):
+            pass  # the segment was rotated (and synced) while we were waiting
+
+async def broadcast(publish=flush_broadcasts):
+    """Flushes the broadcasters in a worker thread so slow clients cannot hold up the loop."""
+    while True:
+        try:
+            await asyncio.to_thread(publish)
+        except Exception as error:
+            print(f"Error broadcasting: {error!r}")
+        await asyncio.sleep(min(broadcast_cadence.values()))
+
+async def run_async(publish=flush_broadcasts):
+    """Ingest, aggregation, persistence and broadcast as separate tasks.
+
+    Frames pass from ingest to aggregation through a bounded queue; aggregation hands closed bars
+    to persistence through the stores and live bars to broadcast through the coalescing
+    BroadcastScheduler, both of which it only ever writes to in memory. A bad frame or a failed
+    persist or broadcast pass is logged and the task carries on, as the threads runtime does.
+    """
+    queue = asyncio.Queue(maxsize=ingest_queue_size)
+    if journal_fsync_interval is not None:
+        for feed in feeds.values():
+            feed.journal.fsync_interval = None  # fsyncs move to sync_journal, off the tick path
+    tasks = [ingest(queue), aggregate(queue), persist(), broadcast(publish)]
+    if journal_fsync_interval is not None:
+        tasks.append(sync_journal())
+    await asyncio.gather(*tasks)
+
+def shard_of(symbol, workers):
+    """Shard index of symbol; crc32 rather than hash() so every process and restart agrees."""
+    return zlib.crc32(symbol.encode()) % workers
+
+outbox = []  # (event, symbol, tf, bars) flushed by a shard process since its last publish
+
+def queue_bars(symbol, tf, bars):
+    outbox.append(('update', symbol, tf, bars))
+
+def queue_revised(symbol, tf, bars):
+    outbox.append(('revised', symbol, tf, bars))
+
+def publish_bars(conn):
+    """Flushes the shard's broadcasters and sends everything they emitted as one IPC message."""
+    flush_broadcasts()
+    if outbox:
+        batch = outbox[:]
+        outbox.clear()
+        conn.send(batch)
+
+def run_shard(shard, workers, names, address, authkey):
+    """Entry point of a shard process: its own WebSocket connection, journal, aggregators and candle files
+    for the symbols hashed onto shard. Every coalesced bar update is published to the web tier."""
+    raise_file_limit()
+    set_symbols([symbol for symbol in names if shard_of(symbol, workers) == shard], queue_bars,
+                lambda symbol, tf: True, queue_revised)
+    load_data_from_csv()
+    conn = Client(address, family='AF_UNIX', authkey=authkey)
+    asyncio.run(run_async(lambda: publish_bars(conn)))
+
+def receive_bars(conn):
+    """Applies the batches a shard publishes to the web tier's mirror feeds and forwards watched ones."""
+    while True:
+        try:
+            batch = conn.recv()
+        except (EOFError, OSError):
+            conn.close()
+            return
+        for event, symbol, tf, bars in batch:
+            feed = feeds.get(symbol)
+            if feed is None:
+                continue
+            if event == 'revised':
+                feed.apply_revised(tf, bars)
+                revise_bars(symbol, tf, bars)
+            else:
+                feed.apply_bars(tf, bars)
+                if is_watched(symbol, tf):
+                    emit_bars(symbol, tf, bars)
+
+def supervise(workers):
+    """Runs the symbols in workers shard processes and restarts any that exit.
+
+    Each shard decodes and aggregates its own symbols on its own core, so ingest is no longer bound to
+    the web tier's GIL. Shards own the journals and candle files; the feeds of this process only mirror
+    the published bars so the HTTP routes can keep serving from memory.
+    """
+    address = os.path.join(tempfile.mkdtemp(prefix='updateFromTick-'), 'bars.sock')
+    authkey = os.urandom(16)
+    listener = Listener(address, family='AF_UNIX', authkey=authkey)
+
+    def accept_forever():
+        while True:
+            conn = listener.accept()
+            threading.Thread(target=receive_bars, args=(conn,), daemon=True).start()
+
+    threading.Thread(target=accept_forever, daemon=True).start()
+    context = multiprocessing.get_context('spawn')  # never fork a process that already runs threads
+    names = list(symbols)
+    shards = sorted({shard_of(symbol, workers) for symbol in names})
+    processes = {}
+    while True:
+        for shard in shards:
+            process = processes.get(shard)
+            if process is None or not process.is_alive():
+                if process is not None:
+                    print(f"Shard {shard} exited with {process.exitcode}, restarting")
+                process = context.Process(target=run_shard, args=(shard, workers, names, address, authkey),
+                                          daemon=True)
+                process.start()
+                processes[shard] = process
+        time.sleep(1)
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runtime', choices=['asyncio', 'threads'], default='asyncio',
+                        help="asyncio tasks (needs the websockets package) or the original thread-per-job setup")
+    parser.add_argument('--workers', type=int, default=0,
+                        help="shard the symbols over this many ingest processes (asyncio runtime; 0 ingests here)")
+    parser.add_argument('--symbols', help="comma-separated symbols to chart, or 'all' for every Bybit linear contract")
+    args = parser.parse_args()
+
+    raise_file_limit()
+    if args.symbols:
+        try:
+            instruments = fetch_linear_instruments()
+        except OSError as error:
+            if args.symbols == 'all':
+                raise
+            print(f"Could not fetch instruments, using the default price scales: {error}")
+            instruments = {}
+        names = list(instruments) if args.symbols == 'all' else args.symbols.split(',')
+        set_price_scales({name: instruments[name] for name in names if name in instruments})
+        set_symbols(names)
+
     load_data_from_csv()  # Load previous data from CSV files
-    
-    ws = websocket.WebSocketApp(ws_url,
-                                on_message=on_message,
-                                on_error=on_error,
-                                on_close=on_close,
-                                on_open=on_open)
-    
-    wst = threading.Thread(target=ws.run_forever)
-    wst.daemon = True
-    wst.start()
-    
-    # Start the data saving thread
-    save_thread = threading.Thread(target=save_data_to_csv)
-    save_thread.daemon = True
-    save_thread.start()
-    
-    socketio.run(app, debug=True, use_reloader=False)
\ No newline at end of file
+
+    if args.workers:
+        # Shards ingest, persist and publish; this process only serves HTTP and Socket.IO
+        supervisor = threading.Thread(target=supervise, args=(args.workers,))
+        supervisor.daemon = True
+        supervisor.start()
+        socketio.run(app, debug=True, use_reloader=False)
+    elif args.runtime == 'asyncio':
+        # HTTP and Socket.IO keep their own thread; everything else runs on the event loop
+        web_thread = threading.Thread(target=socketio.run, args=(app,), kwargs={'debug': True, 'use_reloader': False})
+        web_thread.daemon = True
+        web_thread.start()
+        asyncio.run(run_async())
+    else:
+        ws = websocket.WebSocketApp(ws_url,
+                                    on_message=on_message,
+                                    on_error=on_error,
+                                    on_close=on_close,
+                                    on_open=on_open)
+
+        wst = threading.Thread(target=ws.run_forever)
+        wst.daemon = True
+        wst.start()
+
+        # Start the data saving thread
+        save_thread = threading.Thread(target=save_data_to_csv)
+        save_thread.daemon = True
+        save_thread.start()
+
+        # Start the coalescing broadcast thread
+        broadcast_thread = threading.Thread(target=broadcast_forever)
+        broadcast_thread.daemon = True
+        broadcast_thread.start()
+
+        socketio.run(app, debug=True, use_reloader=False)